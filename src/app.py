@@ -1,4 +1,5 @@
-﻿import logging
+﻿import asyncio
+import logging
 
 from contextlib import asynccontextmanager
 
@@ -9,11 +10,12 @@ from fastapi.middleware.cors import CORSMiddleware
 import logging, sys
 
 from .domain import models
-from sqlalchemy import inspect
+from sqlalchemy import delete, func, insert, inspect, select, text
 from src.infrastructure.infrastructure import engine
 from .config import settings
 from .routes.health import router as health_router
 from .routes.logistica import router as logistica_router
+from .services.logistica_service import close_ms_clients
 from src.errors import NotFoundError, ConflictError
 
 
@@ -28,18 +30,52 @@ logging.basicConfig(
 
 KNOWN_SCHEMAS = ["co","ec","mx","pe"]  # o desde ENV
 
+def _server_default_ddl(schema: str, dialect) -> list[str]:
+    """ALTERs que aplican los server_default a tablas creadas antes de tenerlos."""
+    stmts = []
+    for table in models.Base.metadata.sorted_tables:
+        for column in table.columns:
+            if column.server_default is not None:
+                default = column.server_default.arg.compile(dialect=dialect)
+                stmts.append(
+                    f'ALTER TABLE "{schema}"."{table.name}" ALTER COLUMN "{column.name}" SET DEFAULT {default}'
+                )
+    return stmts
+
+def _init_schema(schema: str) -> None:
+    """
+    Crea/actualiza las tablas del schema solo si su marca `_schema_ready` no
+    coincide con SCHEMA_VERSION: en arranques normales cuesta dos consultas.
+    """
+    eng = engine.execution_options(schema_translate_map={None: schema})
+    with eng.begin() as conn:
+        ready = inspect(conn).has_table(models.SchemaReady.__tablename__, schema=schema)
+        version = conn.execute(select(func.max(models.SchemaReady.version))).scalar() if ready else None
+        if version == models.SCHEMA_VERSION:
+            log.info(f"✅ Schema '{schema}' ya inicializado (version {version})")
+            return
+        models.Base.metadata.create_all(bind=conn)
+        # create_all no toca tablas que ya existían: índices y server_default aparte
+        for table in models.Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+        for stmt in _server_default_ddl(schema, conn.dialect):
+            conn.execute(text(stmt))
+        conn.execute(delete(models.SchemaReady))
+        conn.execute(insert(models.SchemaReady).values(version=models.SCHEMA_VERSION))
+    log.info(f"✅ Schema '{schema}' actualizado: version {version} -> {models.SCHEMA_VERSION}")
+
 @asynccontextmanager
 async def lifespan(app):
-    for schema in KNOWN_SCHEMAS:
-        try:
-            eng = engine.execution_options(schema_translate_map={None: schema})
-            models.Base.metadata.create_all(bind=eng)
-            inspector = inspect(eng)
-            tables = inspector.get_table_names(schema=schema)
-            log.info(f"✅ {len(tables)} tablas creadas/verificadas en schema '{schema}': {tables}")
-        except Exception as e:
-            log.error(f"❌ Error creando tablas en schema {schema}: {e}")
+    results = await asyncio.gather(
+        *(asyncio.to_thread(_init_schema, schema) for schema in KNOWN_SCHEMAS),
+        return_exceptions=True,
+    )
+    for schema, result in zip(KNOWN_SCHEMAS, results):
+        if isinstance(result, Exception):
+            log.error(f"❌ Error creando tablas en schema {schema}: {result}")
     yield
+    close_ms_clients()
     log.info("🛑 Finalizando aplicación ms-logistica")
 
 app = FastAPI(
@@ -13,6 +13,8 @@ class Settings:
     DB_HOST = os.getenv("DB_HOST", "localhost")
     DB_PORT = int(os.getenv("DB_PORT", "5432"))
     DB_NAME = os.getenv("DB_NAME", "db_ms_logistica")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
 
     REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT = os.getenv("REDIS_PORT", "6379")
@@ -33,11 +35,24 @@ class Settings:
         "tipo": "VENTA",
         "estado": "APROBADO"
     }
+    MS_HTTP_POOL_CONNECTIONS = int(os.getenv("MS_HTTP_POOL_CONNECTIONS", "32"))
+    MS_HTTP_POOL_MAXSIZE = int(os.getenv("MS_HTTP_POOL_MAXSIZE", "64"))
+    MS_HTTP_RETRIES = int(os.getenv("MS_HTTP_RETRIES", "3"))
+    PEDIDOS_PAGE_SIZE = int(os.getenv("PEDIDOS_PAGE_SIZE", "200"))
+    PEDIDOS_MAX_WORKERS = int(os.getenv("PEDIDOS_MAX_WORKERS", "8"))
+    USUARIOS_CACHE_TTL_SEC = int(os.getenv("USUARIOS_CACHE_TTL_SEC", "300"))
+    USUARIOS_CACHE_MAXSIZE = int(os.getenv("USUARIOS_CACHE_MAXSIZE", "10000"))
+    RUTA_CACHE_ENABLED = os.getenv("RUTA_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    RUTA_CACHE_TTL_SEC = int(os.getenv("RUTA_CACHE_TTL_SEC", "30"))
+    RUTA_CACHE_MAXSIZE = int(os.getenv("RUTA_CACHE_MAXSIZE", "2048"))
 
     TOPIC_PEDIDOS = os.getenv("TOPIC_PEDIDOS")
     TOPIC_INVENTARIO = os.getenv("TOPIC_INVENTARIO")
     TOPIC_LOGISTICA = os.getenv("TOPIC_LOGISTICA")
     TOPIC_VENTAS_CRM = os.getenv("TOPIC_VENTAS_CRM")
     TOPIC_TELEMETRIA = os.getenv("TOPIC_TELEMETRIA")
+    PUBSUB_BATCH_MAX_MESSAGES = int(os.getenv("PUBSUB_BATCH_MAX_MESSAGES", "100"))
+    PUBSUB_BATCH_MAX_BYTES = int(os.getenv("PUBSUB_BATCH_MAX_BYTES", str(1024 * 1024)))
+    PUBSUB_BATCH_MAX_LATENCY_SEC = float(os.getenv("PUBSUB_BATCH_MAX_LATENCY_SEC", "0.01"))
 
 settings = Settings()
@@ -13,9 +13,11 @@ class AuditContext:
     ip: str | None
 
 
+def get_schema(X_Country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER)) -> str:
+    return (X_Country or settings.DEFAULT_SCHEMA).strip().lower()
+
 def get_session(X_Country: str | None = Header(default=None, alias=settings.COUNTRY_HEADER)):
-    schema = (X_Country or settings.DEFAULT_SCHEMA).strip().lower()
-    with session_for_schema(schema) as session:
+    with session_for_schema(get_schema(X_Country)) as session:
         yield session
 
 def audit_context(request: Request) -> AuditContext:
@@ -4,12 +4,34 @@ import enum, uuid
 from datetime import datetime, date
 from typing import List, Optional
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import Date, DateTime, Enum, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy import Date, DateTime, Enum, ForeignKey, Index, Integer, String, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
 
 class Base(DeclarativeBase):
     pass
 
+# Versión del esquema; se registra en `_schema_ready` al inicializar cada schema.
+SCHEMA_VERSION = 3
+
+class utcnow(FunctionElement):
+    """Marca de tiempo UTC generada por la BD (server_default)."""
+    type = DateTime()
+    inherit_cache = True
+
+@compiles(utcnow, "postgresql")
+def _pg_utcnow(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+@compiles(utcnow)
+def _default_utcnow(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+class SchemaReady(Base):
+    __tablename__ = "_schema_ready"
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+
 class RutaEstado(str, enum.Enum):
     PLANEADA = "PLANEADA"
     EN_RUTA = "EN_RUTA"
@@ -26,9 +48,14 @@ class RutaEntrega(Base):
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     fecha: Mapped[date] = mapped_column(Date, nullable=False)
     estado: Mapped[RutaEstado] = mapped_column(Enum(RutaEstado), nullable=False, default=RutaEstado.PLANEADA)
-    creado_en: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    creado_en: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=utcnow())
     paradas: Mapped[List["Parada"]] = relationship("Parada", back_populates="ruta", cascade="all, delete-orphan", lazy="selectin")
 
+    # chequeo de duplicados en generar_ruta y listado por fecha
+    __table_args__ = (Index("ix_ruta_entrega_fecha_estado", "fecha", "estado"),)
+    # trae creado_en en el mismo INSERT (RETURNING) en vez de un SELECT posterior
+    __mapper_args__ = {"eager_defaults": True}
+
 class Parada(Base):
     __tablename__ = "parada"
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -38,7 +65,7 @@ class Parada(Base):
     ciudad: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     estado: Mapped[ParadaEstado] = mapped_column(Enum(ParadaEstado), nullable=False, default=ParadaEstado.PENDIENTE)
     orden: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
-    creado_en: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    creado_en: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=utcnow())
 
     ruta: Mapped["RutaEntrega"] = relationship("RutaEntrega", back_populates="paradas")
     # Relación con la tabla puente (cada fila trae un pedido_id remoto)
@@ -46,6 +73,8 @@ class Parada(Base):
         "ParadaPedido", back_populates="parada", cascade="all, delete-orphan", lazy="selectin"
     )
 
+    __table_args__ = (Index("ix_parada_ruta_id", "ruta_id"),)
+
 class ParadaPedido(Base):
     __tablename__ = "parada_pedido"
     # FK SOLO a parada; pedido_id es UUID sin FK (vive en otro microservicio)
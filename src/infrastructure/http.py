@@ -1,19 +1,56 @@
 # src/infra/http.py
 import os, requests
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from src.config import settings
 
+
+def _build_session() -> requests.Session:
+    """
+    Session con pool de conexiones (keep-alive) y reintentos de transporte.
+    Retry solo reintenta métodos idempotentes (GET); los POST conservan su
+    lógica de reintento en el servicio.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings.MS_HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.MS_HTTP_POOL_MAXSIZE,
+        max_retries=Retry(
+            total=settings.MS_HTTP_RETRIES,
+            backoff_factor=0.1,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False,  # la última respuesta llega a _raise
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 class MsClient:
+    # Compartida por todas las instancias (todos los países): un solo pool hacia el gateway
+    _session: requests.Session = _build_session()
+
     def __init__(self, x_country: str):
+        self.x_country = x_country
         self.base = settings.GATEWAY_BASE_URL.rstrip("/")
         self.h = {"Content-Type": "application/json", settings.COUNTRY_HEADER: x_country}
+        self.session = MsClient._session
 
     def post(self, path: str, json=None, params=None):
-        r = requests.post(f"{self.base}{path}", headers=self.h, json=json, params=params, timeout=30)
-        self._raise(r); return r.json() if r.content else None
+        # Cuerpo pre-serializado con orjson; Content-Type ya va en self.h
+        data = orjson.dumps(json) if json is not None else None
+        r = self.session.post(f"{self.base}{path}", headers=self.h, data=data, params=params, timeout=30)
+        self._raise(r); return orjson.loads(r.content) if r.content else None
 
     def get(self, path: str, params=None):
-        r = requests.get(f"{self.base}{path}", headers=self.h, params=params, timeout=30)
-        self._raise(r); return r.json() if r.content else None
+        r = self.session.get(f"{self.base}{path}", headers=self.h, params=params, timeout=30)
+        self._raise(r); return orjson.loads(r.content) if r.content else None
+
+    def close(self):
+        # libera las conexiones ociosas del pool compartido; la Session sigue usable
+        self.session.close()
 
     def _raise(self, r):
         if r.status_code >= 400:
@@ -1,15 +1,23 @@
+from concurrent.futures import wait
 from contextlib import contextmanager
+from functools import lru_cache
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from google.cloud import pubsub_v1
 from src.config import settings
-from typing import Optional
+from typing import Iterable, List, Optional
 from redis import Redis
-import json
+import orjson
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
+# Motor sync (psycopg2): los servicios, session_for_schema y los tests sobre
+# SQLite son síncronos. El pool se dimensiona para las rutas sync del threadpool.
+engine = create_engine(
+    settings.SQLALCHEMY_DATABASE_URI,
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+)
 _redis_client: Optional[Redis] = None
-_publisher: Optional[pubsub_v1.PublisherClient] = None
 
 SessionLocal = sessionmaker(
     bind=engine,
@@ -36,23 +44,46 @@ def get_redis() -> Optional[Redis]:
         _redis_client = Redis(host=settings.REDIS_HOST, port=int(settings.REDIS_PORT), decode_responses=True)
     return _redis_client
 
+@lru_cache(maxsize=1)
 def get_publisher() -> pubsub_v1.PublisherClient:
     """
     Devuelve un PublisherClient singleton, inicializado de forma lazy.
     Esto evita que se creen credenciales en import time (útil para tests).
+    lru_cache garantiza un único cliente (y canal gRPC) por proceso.
+    Los mensajes se agrupan según PUBSUB_BATCH_* para amortizar los RPC.
     """
-    global _publisher
-    if _publisher is None:
-        _publisher = pubsub_v1.PublisherClient()
-    return _publisher
+    batch_settings = pubsub_v1.types.BatchSettings(
+        max_messages=settings.PUBSUB_BATCH_MAX_MESSAGES,
+        max_bytes=settings.PUBSUB_BATCH_MAX_BYTES,
+        max_latency=settings.PUBSUB_BATCH_MAX_LATENCY_SEC,
+    )
+    return pubsub_v1.PublisherClient(batch_settings=batch_settings)
 
 
-def publish_event(data: dict, topic_path: str) -> None:
+def publish_event(data: dict, topic_path: str):
     """
-    Publica un evento en Pub/Sub.
+    Publica un evento en Pub/Sub sin esperar la confirmación.
 
     :param data: dict serializable a JSON
     :param topic_path: 'projects/.../topics/...'
+    :return: future de la publicación; `.result()` bloquea hasta el ack
+    """
+    # orjson devuelve bytes UTF-8 directamente; default=str cubre lo que no serializa
+    payload = orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return get_publisher().publish(topic_path, payload)
+
+
+def publish_events_batch(items: Iterable[dict], topic_path: str, timeout: float = 30) -> List[str]:
+    """
+    Publica varios eventos y espera sus confirmaciones con un único plazo.
+    Hoy no lo usa el servicio (pedido_despachado no espera acks); queda para
+    quien necesite confirmar un lote completo.
+
+    :return: message_ids en el mismo orden; TimeoutError si el lote no se
+             confirmó a tiempo, o la excepción del primer evento rechazado
     """
-    payload = json.dumps(data, ensure_ascii=False, default=str).encode("utf-8")
-    future = get_publisher().publish(topic_path, payload)
\ No newline at end of file
+    futures = [publish_event(data, topic_path) for data in items]
+    _, pendientes = wait(futures, timeout=timeout)
+    if pendientes:
+        raise TimeoutError(f"{len(pendientes)} eventos sin confirmación de Pub/Sub tras {timeout}s")
+    return [f.result() for f in futures]
@@ -0,0 +1,35 @@
+# src/responses.py
+from datetime import date, datetime
+from enum import Enum
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def _default(obj: Any):
+    """Tipos que orjson no serializa por sí solo."""
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+class PydanticORJSONResponse(JSONResponse):
+    """
+    Respuesta JSON serializada con orjson.
+
+    Se devuelve directamente desde las rutas para saltar `jsonable_encoder`
+    y la re-validación del `response_model` de FastAPI.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_UUID | orjson.OPT_NAIVE_UTC,
+        )
@@ -1,37 +1,78 @@
-from fastapi import APIRouter, Depends, Query, Body
+from fastapi import APIRouter, Depends, Query, Body, Response
 from datetime import date
+import threading
 from uuid import UUID
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional  # <-- si lo requieres
+from cachetools import TTLCache
 
-from src.dependencies import get_session, audit_context, AuditContext
+from src.config import settings
+from src.dependencies import get_schema, get_session, audit_context, AuditContext
 from src.services import logistica_service   # <-- nombre correcto
+from src.infrastructure.infrastructure import session_for_schema
 from src.domain.schemas import RutaEntregaOut, ParadaOut
 from src.domain.models import ParadaEstado
+from src.responses import PydanticORJSONResponse
 
 router = APIRouter(prefix="/v1/logistica", tags=["logistica"])
 
-def _serialize_ruta(ruta) -> RutaEntregaOut:
-    return RutaEntregaOut(
-        id=ruta.id,
-        fecha=ruta.fecha,
-        estado=ruta.estado,
-        creado_en=ruta.creado_en,
-        paradas=[
-            ParadaOut(
-                id=pa.id,
-                cliente_id=pa.cliente_id,
-                direccion=pa.direccion,
-                ciudad=pa.ciudad,
-                estado=pa.estado,
-                orden=pa.orden,
-                # OJO: ahora 'pa.pedidos' son vínculos (ParadaPedido)
-                pedido_ids=[v.pedido_id for v in getattr(pa, "pedidos", [])],
-            )
+# Respuestas ya serializadas de GET /rutas/{id}: (schema, ruta_id) -> bytes.
+# Se invalidan al cambiar el estado de una parada, *después* del commit (por eso
+# esos handlers abren su propia sesión); el TTL acota la desactualización entre
+# instancias.
+# Cada invalidación sube la generación de la ruta: un GET solo guarda su blob si
+# la generación no cambió desde antes de leer, así no re-cachea un estado viejo.
+_RUTA_BLOBS: TTLCache = TTLCache(maxsize=settings.RUTA_CACHE_MAXSIZE, ttl=settings.RUTA_CACHE_TTL_SEC)
+_RUTA_GENERACION: TTLCache = TTLCache(maxsize=settings.RUTA_CACHE_MAXSIZE, ttl=settings.RUTA_CACHE_TTL_SEC)
+_RUTA_BLOBS_LOCK = threading.Lock()
+
+def _guardar_ruta(key, generacion: int, blob: bytes) -> None:
+    with _RUTA_BLOBS_LOCK:
+        if _RUTA_GENERACION.get(key, 0) == generacion:
+            _RUTA_BLOBS[key] = blob
+
+def _invalidar_ruta(schema: str, ruta_id: UUID) -> None:
+    key = (schema, ruta_id)
+    with _RUTA_BLOBS_LOCK:
+        _RUTA_GENERACION[key] = _RUTA_GENERACION.get(key, 0) + 1
+        _RUTA_BLOBS.pop(key, None)
+
+# Las respuestas se arman como dicts planos y se devuelven en un
+# PydanticORJSONResponse: ni se construyen modelos Pydantic ni FastAPI pasa el
+# payload por jsonable_encoder / `response_model`, que queda solo para documentar
+# el contrato en OpenAPI. orjson serializa UUID y fechas de forma nativa.
+
+def _serialize_parada(pa, pedido_ids=None) -> dict:
+    return {
+        "id": pa.id,
+        "cliente_id": pa.cliente_id,
+        "direccion": pa.direccion,
+        "ciudad": pa.ciudad,
+        "estado": pa.estado.value,
+        "orden": pa.orden,
+        # OJO: ahora 'pa.pedidos' son vínculos (ParadaPedido)
+        "pedido_ids": pedido_ids if pedido_ids is not None else [v.pedido_id for v in getattr(pa, "pedidos", [])],
+    }
+
+def _serialize_ruta(ruta, pedidos_por_parada=None, include_paradas: bool = True) -> dict:
+    """
+    `pedidos_por_parada` (parada_id -> pedido_ids) evita leer `pa.pedidos`;
+    sin `include_paradas` no se tocan las paradas y se emite `paradas=[]`.
+    """
+    paradas = []
+    if include_paradas:
+        paradas = [
+            _serialize_parada(pa, None if pedidos_por_parada is None else pedidos_por_parada.get(pa.id, []))
             for pa in ruta.paradas
-        ],
-    )
+        ]
+    return {
+        "id": ruta.id,
+        "fecha": ruta.fecha,
+        "estado": ruta.estado.value,
+        "creado_en": ruta.creado_en,
+        "paradas": paradas,
+    }
 
 @router.post("/rutas/generar", response_model=RutaEntregaOut, status_code=201)
 def generar_ruta(
@@ -50,23 +91,41 @@ def generar_ruta(
         fc_desde=fc_desde, fc_hasta=fc_hasta,
         limit=limit, offset=offset
     )
-    return _serialize_ruta(ruta)
+    return PydanticORJSONResponse(_serialize_ruta(ruta), status_code=201)
 
 @router.get("/rutas/{ruta_id}", response_model=RutaEntregaOut)
 def obtener_ruta(
     ruta_id: UUID,
-    session: Session = Depends(get_session),
+    schema: str = Depends(get_schema),
 ):
-    ruta = logistica_service.obtener_ruta(session, ruta_id)
-    return _serialize_ruta(ruta)
+    key = (schema, ruta_id)
+    if settings.RUTA_CACHE_ENABLED:
+        with _RUTA_BLOBS_LOCK:
+            blob = _RUTA_BLOBS.get(key)
+            generacion = _RUTA_GENERACION.get(key, 0)
+        if blob is not None:
+            # hit: sin checkout del pool ni transacción
+            return Response(content=blob, media_type="application/json")
+
+    with session_for_schema(schema) as session:
+        ruta = logistica_service.obtener_ruta(session, ruta_id)
+        response = PydanticORJSONResponse(_serialize_ruta(ruta))
+    if settings.RUTA_CACHE_ENABLED:
+        _guardar_ruta(key, generacion, response.body)
+    return response
 
 @router.get("/rutas", response_model=list[RutaEntregaOut])
 def listar_rutas(
     fecha: date = Query(..., description="Fecha de compromiso"),
+    include: list[str] = Query(default=[], description="Relaciones a incluir: 'paradas'"),
     session: Session = Depends(get_session),
 ):
-    rutas = logistica_service.listar_rutas_por_fecha(session, fecha)
-    return [_serialize_ruta(r) for r in rutas]
+    include_paradas = "paradas" in include
+    rutas = logistica_service.listar_rutas_por_fecha(session, fecha, include_paradas=include_paradas)
+    if not include_paradas:
+        return PydanticORJSONResponse([_serialize_ruta(r, include_paradas=False) for r in rutas])
+    by_parada = logistica_service.pedidos_por_parada(session, [pa.id for r in rutas for pa in r.paradas])
+    return PydanticORJSONResponse([_serialize_ruta(r, by_parada) for r in rutas])
 
 class ParadaEstadoIn(BaseModel):
     estado: ParadaEstado
@@ -75,15 +134,32 @@ class ParadaEstadoIn(BaseModel):
 def actualizar_estado_parada(
     parada_id: UUID,
     payload: ParadaEstadoIn = Body(...),
-    session: Session = Depends(get_session),
+    schema: str = Depends(get_schema),
 ):
-    pa = logistica_service.actualizar_estado_parada(session, parada_id, payload.estado)
-    return ParadaOut(
-        id=pa.id,
-        cliente_id=pa.cliente_id,
-        direccion=pa.direccion,
-        ciudad=pa.ciudad,
-        estado=pa.estado,
-        orden=pa.orden,
-        pedido_ids=[v.pedido_id for v in getattr(pa, "pedidos", [])],
-    )
+    with session_for_schema(schema) as session:
+        pa = logistica_service.actualizar_estado_parada(session, parada_id, payload.estado)
+        response = PydanticORJSONResponse(_serialize_parada(pa))
+    # ya confirmado: un GET concurrente no puede volver a cachear el estado anterior
+    _invalidar_ruta(schema, pa.ruta_id)
+    return response
+
+class ParadaEstadoItem(BaseModel):
+    id: UUID
+    estado: ParadaEstado
+
+class BulkParadaEstadoIn(BaseModel):
+    items: list[ParadaEstadoItem]
+
+@router.patch("/paradas/estado", response_model=list[ParadaOut])
+def actualizar_estado_paradas(
+    payload: BulkParadaEstadoIn = Body(...),
+    schema: str = Depends(get_schema),
+):
+    with session_for_schema(schema) as session:
+        paradas = logistica_service.actualizar_estado_paradas(
+            session, [(item.id, item.estado) for item in payload.items]
+        )
+        response = PydanticORJSONResponse([_serialize_parada(pa) for pa in paradas])
+    for ruta_id in {pa.ruta_id for pa in paradas}:
+        _invalidar_ruta(schema, ruta_id)
+    return response
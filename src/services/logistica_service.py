@@ -1,18 +1,25 @@
 # src/services/logistica_service.py
 from datetime import date
 from collections import defaultdict
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 from typing import Optional, Dict, Tuple, List
 import time
 import logging
+import threading
 from uuid import UUID
 import uuid
 
+from cachetools import TTLCache
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import make_transient_to_detached, raiseload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from src.errors import NotFoundError, ConflictError
 from src.domain.models import RutaEntrega, Parada, ParadaPedido, RutaEstado, ParadaEstado
-from src.dependencies import AuditContext
+from src.dependencies import AuditContext, get_schema
 from src.config import Settings
 from src.infrastructure.http import MsClient
 from src.infrastructure.infrastructure import publish_event
@@ -24,10 +31,41 @@ EST_APROBADO = "APROBADO"
 
 MAX_RETRIES = 3
 RETRY_SLEEP_SEC = 0.6
+USUARIOS_MAX_WORKERS = 16
+
+# Caché de proceso de ms-usuarios, compartida entre requests: (x_country, cliente_id) -> detalle
+_CLIENTES_CACHE: TTLCache = TTLCache(maxsize=Settings.USUARIOS_CACHE_MAXSIZE, ttl=Settings.USUARIOS_CACHE_TTL_SEC)
+_CLIENTES_CACHE_LOCK = threading.Lock()
+
+# Un MsClient por país, reutilizado entre requests (pool de conexiones keep-alive)
+_MS_CLIENTS: Dict[str, MsClient] = {}
+_MS_CLIENTS_LOCK = threading.Lock()
 
 
 # ---------- Helpers MS externos ----------
 
+def _get_ms(x_country: Optional[str]) -> MsClient:
+    # misma normalización que el esquema de la sesión: "CO", " co" y None (-> DEFAULT_SCHEMA)
+    # comparten cliente y entradas de _CLIENTES_CACHE
+    x_country = get_schema(x_country)
+    ms = _MS_CLIENTS.get(x_country)
+    if ms is None:
+        with _MS_CLIENTS_LOCK:
+            ms = _MS_CLIENTS.get(x_country)
+            if ms is None:
+                ms = _MS_CLIENTS[x_country] = MsClient(x_country=x_country)
+    return ms
+
+
+def close_ms_clients() -> None:
+    """Cierra los MsClient compartidos (apagado de la aplicación)."""
+    with _MS_CLIENTS_LOCK:
+        clients = list(_MS_CLIENTS.values())
+        _MS_CLIENTS.clear()
+    for ms in clients:
+        ms.close()
+
+
 def _normalize(s: Optional[str]) -> Optional[str]:
     if s is None:
         return None
@@ -35,71 +73,146 @@ def _normalize(s: Optional[str]) -> Optional[str]:
     return s.casefold() if s else None
 
 
+def _cliente_info(direccion: Optional[str], ciudad: Optional[str]) -> Dict[str, Optional[str]]:
+    """Detalle de cliente con las claves de agrupación ya normalizadas (una vez por cliente)."""
+    return {
+        "direccion": direccion,
+        "ciudad": ciudad,
+        "_direccion_norm": _normalize(direccion),
+        "_ciudad_norm": _normalize(ciudad),
+    }
+
+
 def _ms_usuarios_detalle(
     ms: MsClient,
     cliente_id: Optional[int],
     cache: Dict[int, Dict[str, Optional[str]]],
 ) -> Dict[str, Optional[str]]:
     """
-    Devuelve {"direccion": str|None, "ciudad": str|None} consultando ms-usuarios.
-    Usa caché por cliente. Tolera errores devolviendo None/None.
+    Devuelve {"direccion": str|None, "ciudad": str|None} consultando ms-usuarios,
+    junto con sus versiones normalizadas `_direccion_norm`/`_ciudad_norm`.
+    Usa caché por request (`cache`) y, detrás, la caché TTL de proceso.
+    Tolera errores devolviendo None/None (los fallos no se cachean entre requests).
     """
     if not cliente_id:
-        return {"direccion": None, "ciudad": None}
+        return _cliente_info(None, None)
     if cliente_id in cache:
         return cache[cliente_id]
+    key = (ms.x_country, cliente_id)
+    with _CLIENTES_CACHE_LOCK:
+        out = _CLIENTES_CACHE.get(key)
+    if out is not None:
+        cache[cliente_id] = out
+        return out
     try:
         path = Settings.USERS_CLIENTE_DETALLE_PATH.format(cliente_id=cliente_id)
         logger.debug("Consultando ms-usuarios: path=%s cliente_id=%s", path, cliente_id)
         data = ms.get(path)
-        out = {
-            # mapeamos a claves internas en español, pero aceptamos inglés al leer
-            "direccion": data.get("direccion") or data.get("address"),
-            "ciudad": data.get("ciudad") or data.get("city"),
-        }
+        # mapeamos a claves internas en español, pero aceptamos inglés al leer
+        out = _cliente_info(
+            data.get("direccion") or data.get("address"),
+            data.get("ciudad") or data.get("city"),
+        )
         logger.debug("Respuesta ms-usuarios cliente_id=%s -> %s", cliente_id, out)
         cache[cliente_id] = out
+        with _CLIENTES_CACHE_LOCK:
+            _CLIENTES_CACHE[key] = out
         return out
     except Exception as e:
         logger.warning("Fallo ms-usuarios cliente_id=%s: %s", cliente_id, e)
-        out = {"direccion": None, "ciudad": None}
+        out = _cliente_info(None, None)
         cache[cliente_id] = out
         return out
 
 
+def _ms_usuarios_prefetch(
+    ms: MsClient,
+    cliente_ids,
+    cache: Dict[int, Dict[str, Optional[str]]],
+) -> None:
+    """
+    Precarga en `cache` el detalle de los clientes distintos: primero desde la
+    caché de proceso y, solo para los que falten, en paralelo desde ms-usuarios.
+    Cada consulta tolera sus propios errores (ver `_ms_usuarios_detalle`).
+    """
+    pendientes = []
+    with _CLIENTES_CACHE_LOCK:
+        for cid in cliente_ids:
+            if not cid or cid in cache:
+                continue
+            out = _CLIENTES_CACHE.get((ms.x_country, cid))
+            if out is not None:
+                cache[cid] = out
+            else:
+                pendientes.append(cid)
+    if not pendientes:
+        return
+    logger.debug("Precargando %d clientes desde ms-usuarios", len(pendientes))
+    with ThreadPoolExecutor(max_workers=min(USUARIOS_MAX_WORKERS, len(pendientes))) as pool:
+        list(pool.map(lambda cid: _ms_usuarios_detalle(ms, cid, cache), pendientes))
+
+
+def _ms_pedidos_pagina(ms: MsClient, params: dict) -> List[dict]:
+    resp = ms.get(Settings.PEDIDOS_LISTAR_PATH, params=params)
+    if isinstance(resp, list):
+        logger.debug("ms-pedidos devolvió lista con %d elementos", len(resp))
+        return resp
+    if isinstance(resp, dict):
+        items = resp.get("items", [])
+        logger.debug("ms-pedidos devolvió dict con %d items", len(items))
+        return items
+    logger.debug("ms-pedidos devolvió tipo no esperado (%s). Se asume lista vacía.", type(resp))
+    return []
+
+
 def _ms_pedidos_listar_aprobados(
     ms: MsClient, *, fecha: date, tipo: str,
     fc_desde: Optional[date], fc_hasta: Optional[date],
     limit: int, offset: int
 ) -> List[dict]:
-    params = {
+    """
+    Lista pedidos aprobados. Si `limit` supera PEDIDOS_PAGE_SIZE, las páginas
+    [offset, offset+page, ...] se piden en paralelo (hasta PEDIDOS_MAX_WORKERS
+    a la vez) y se concatenan en orden,
+    cortando en la primera página incompleta.
+    """
+    base = {
         "tipo": tipo,
         "estado": EST_APROBADO,
         "fecha_compromiso": fecha.isoformat(),
-        "limit": str(limit),
-        "offset": str(offset),
     }
     if fc_desde:
-        params["fc_desde"] = fc_desde.isoformat()
+        base["fc_desde"] = fc_desde.isoformat()
     if fc_hasta:
-        params["fc_hasta"] = fc_hasta.isoformat()
+        base["fc_hasta"] = fc_hasta.isoformat()
 
-    logger.info("Listando pedidos aprobados en ms-pedidos: params=%s", params)
-    try:
-        resp = ms.get(Settings.PEDIDOS_LISTAR_PATH, params=params)
-        if isinstance(resp, list):
-            logger.debug("ms-pedidos devolvió lista con %d elementos", len(resp))
-            return resp
-        if isinstance(resp, dict):
-            items = resp.get("items", [])
-            logger.debug("ms-pedidos devolvió dict con %d items", len(items))
-            return items
-        logger.debug("ms-pedidos devolvió tipo no esperado (%s). Se asume lista vacía.", type(resp))
+    if limit <= 0:
+        logger.info("limit=%s no positivo: no se consulta ms-pedidos", limit)
         return []
+
+    page_size = Settings.PEDIDOS_PAGE_SIZE
+    paginas = [
+        {**base, "limit": str(min(page_size, offset + limit - off)), "offset": str(off)}
+        for off in range(offset, offset + limit, page_size)
+    ]
+
+    logger.info("Listando pedidos aprobados en ms-pedidos: params=%s paginas=%d", paginas[0], len(paginas))
+    try:
+        if len(paginas) == 1:
+            return _ms_pedidos_pagina(ms, paginas[0])
+        with ThreadPoolExecutor(max_workers=min(Settings.PEDIDOS_MAX_WORKERS, len(paginas))) as pool:
+            resultados = list(pool.map(lambda params: _ms_pedidos_pagina(ms, params), paginas))
     except Exception as e:
         logger.error("Error consultando ms-pedidos: %s", e)
         raise NotFoundError(f"No fue posible consultar pedidos aprobados: {e}")
 
+    pedidos: List[dict] = []
+    for params, items in zip(paginas, resultados):
+        pedidos.extend(items)
+        if len(items) < int(params["limit"]):
+            break
+    return pedidos
+
 
 def _ms_pedido_marcar_despachado(ms: MsClient, pedido_id: str) -> bool:
     path = Settings.PEDIDO_MARCAR_DESPACHADO_PATH.format(pedido_id=pedido_id)
@@ -123,9 +236,22 @@ def _ms_pedido_marcar_despachado(ms: MsClient, pedido_id: str) -> bool:
     logger.error("No se pudo marcar DESPACHADO pedido_id=%s. Último error: %s", pedido_id, last_exc)
     return False
 
-def _emit_pedido_despachado_event(pedido_id: UUID, x_country: str, audit: AuditContext) -> bool:
+def _log_publish_fallido(pedido_id: UUID, topic: str, future) -> None:
+    """Callback de la publicación: solo registra el fallo, nadie espera el ack."""
+    exc = future.exception()
+    if exc is not None:
+        logger.error(
+            "No se confirmó evento pedido_despachado pedido_id=%s en topic=%s: %s",
+            pedido_id, topic, exc,
+        )
+
+def _emit_pedidos_despachados_events(pedido_ids: List[UUID], audit: AuditContext) -> bool:
     """
-    Publica el evento 'pedido_despachado' en el tópico de pedidos.
+    Publica un evento 'pedido_despachado' por pedido en el tópico de pedidos.
+
+    No espera las confirmaciones: el request no retiene el hilo ni la conexión
+    mientras Pub/Sub responde. Los fallos de entrega se registran por pedido en
+    un callback del future. Devuelve False si algún evento no pudo encolarse.
 
     ms-pedidos debe tener una suscripción a ese tópico y manejar el evento
     en su endpoint /pubsub (event == 'pedido_despachado').
@@ -135,27 +261,52 @@ def _emit_pedido_despachado_event(pedido_id: UUID, x_country: str, audit: AuditC
         logger.error("TOPIC_PEDIDOS no configurado; no se puede emitir evento pedido_despachado")
         return False
 
-    event = {
-        "event": "pedido_despachado",
-        "pedido_id": str(pedido_id),
-        "ctx": {
-            "country": audit.country or settings.DEFAULT_SCHEMA,
-            "request_id": getattr(audit, "request_id", None),
-            "user_id": getattr(audit, "user_id", None),
-            "ip": getattr(audit, "ip", None),
-        },
+    ctx = {
+        "country": audit.country or Settings.DEFAULT_SCHEMA,
+        "request_id": getattr(audit, "request_id", None),
+        "user_id": getattr(audit, "user_id", None),
+        "ip": getattr(audit, "ip", None),
     }
 
-    try:
-        logger.info("Emitiendo evento pedido_despachado: %s", event)
-        publish_event(event, topic)
-        return True
-    except Exception as e:
-        logger.error(
-            "No se pudo publicar evento pedido_despachado pedido_id=%s en topic=%s: %s",
-            pedido_id, topic, e,
-        )
-        return False
+    all_ok = True
+    for pedido_id in pedido_ids:
+        event = {"event": "pedido_despachado", "pedido_id": str(pedido_id), "ctx": ctx}
+        try:
+            logger.info("Emitiendo evento pedido_despachado: %s", event)
+            future = publish_event(event, topic)
+        except Exception as e:
+            all_ok = False
+            logger.error(
+                "No se pudo publicar evento pedido_despachado pedido_id=%s en topic=%s: %s",
+                pedido_id, topic, e,
+            )
+            continue
+        future.add_done_callback(functools.partial(_log_publish_fallido, pedido_id, topic))
+    return all_ok
+
+def _adjuntar_paradas(
+    session: Session, ruta: RutaEntrega, parada_rows: List[dict], parada_pedido_rows: List[dict]
+) -> None:
+    """
+    Cuelga de `ruta` las paradas y vínculos recién insertados en bloque, como si
+    se hubieran cargado de la BD, para no releerlos con un `refresh`.
+    """
+    pedidos_por_parada: Dict[UUID, List[ParadaPedido]] = defaultdict(list)
+    for row in parada_pedido_rows:
+        vinculo = ParadaPedido(**row)
+        make_transient_to_detached(vinculo)
+        pedidos_por_parada[row["parada_id"]].append(vinculo)
+
+    paradas: List[Parada] = []
+    for row in parada_rows:
+        parada = Parada(**row)
+        make_transient_to_detached(parada)
+        set_committed_value(parada, "pedidos", pedidos_por_parada[row["id"]])
+        paradas.append(parada)
+
+    session.add_all(paradas)  # detached -> persistent, sin emitir INSERT
+    set_committed_value(ruta, "paradas", paradas)
+
 
 # ---------- Casos de uso ----------
 
@@ -167,14 +318,13 @@ def generar_ruta(
 ) -> RutaEntrega:
     """
     Crea una RutaEntrega para `fecha` agrupando Paradas por (cliente_id, direccion, ciudad).
-    Luego ordena a ms-pedidos marcar cada pedido como DESPACHADO (uno a uno).
+    Luego ordena a ms-pedidos marcar cada pedido como DESPACHADO (en paralelo, vía eventos).
     """
-    x_country = audit.country or "co"
+    ms = _get_ms(audit.country)
     logger.info(
         "Generar ruta: fecha=%s tipo=%s fc_desde=%s fc_hasta=%s limit=%s offset=%s X-Country=%s",
-        fecha, tipo, fc_desde, fc_hasta, limit, offset, x_country
+        fecha, tipo, fc_desde, fc_hasta, limit, offset, ms.x_country
     )
-    ms = MsClient(x_country=x_country)
 
     # 1) Obtener pedidos aprobados desde ms-pedidos
     pedidos = _ms_pedidos_listar_aprobados(
@@ -187,16 +337,21 @@ def generar_ruta(
     logger.debug("Pedidos recibidos: %d", len(pedidos))
 
     # 2) Evitar duplicados por fecha
-    ya = session.execute(
-        select(RutaEntrega).where(RutaEntrega.fecha == fecha, RutaEstado.CANCELADA != RutaEntrega.estado)
-    ).scalars().first()
-    if ya:
-        logger.info("Ruta ya existente para fecha=%s id=%s estado=%s -> 409", fecha, ya.id, ya.estado)
-        raise ConflictError(f"Ya existe una ruta para {fecha} (id={ya.id})")
+    # solo el id: sin hidratar la ruta ni disparar el selectin de sus paradas
+    ya_id = session.execute(
+        select(RutaEntrega.id)
+        .where(RutaEntrega.fecha == fecha, RutaEntrega.estado != RutaEstado.CANCELADA)
+        .limit(1)
+    ).scalar()
+    if ya_id:
+        logger.info("Ruta ya existente para fecha=%s id=%s -> 409", fecha, ya_id)
+        raise ConflictError(f"Ya existe una ruta para {fecha} (id={ya_id})")
 
     # 3) Enriquecer y agrupar
     cache_clientes: Dict[int, Dict[str, Optional[str]]] = {}
     grupos: Dict[Tuple[Optional[int], Optional[str], Optional[str]], list] = defaultdict(list)
+    valid_pids: List[UUID] = []  # ids ya parseados; se reutilizan al marcar DESPACHADO
+    _ms_usuarios_prefetch(ms, {ped.get("cliente_id") for ped in pedidos}, cache_clientes)
 
     for ped in pedidos:
         # Convertimos el id a UUID para almacenar correctamente
@@ -206,100 +361,130 @@ def generar_ruta(
         except Exception as e:
             logger.warning("Pedido con id inválido (%r); se omite. Error: %s", pid_raw, e)
             continue
+        valid_pids.append(pid)
 
         cliente_id = ped.get("cliente_id")
         info = _ms_usuarios_detalle(ms, cliente_id, cache_clientes)
-        # <- toma en inglés primero (y deja fallback a español del helper)
-        direccion = info.get("direccion") or info.get("address")  # normalmente viene 'address'
-        ciudad = info.get("ciudad") or info.get("city")           # normalmente viene 'city'
+        direccion = info["direccion"]
+        ciudad = info["ciudad"]
 
-        key = (cliente_id, _normalize(direccion), _normalize(ciudad))
+        key = (cliente_id, info["_direccion_norm"], info["_ciudad_norm"])
         grupos[key].append((pid, cliente_id, direccion, ciudad))
 
     logger.debug("Total grupos (paradas) a crear: %d", len(grupos))
 
-    # 4) Crear ruta y paradas
+    # 4) Crear ruta y paradas (paradas y vínculos en un INSERT por tabla)
     ruta = RutaEntrega(fecha=fecha, estado=RutaEstado.PLANEADA)
     session.add(ruta)
     session.flush()
     logger.info("Ruta creada: id=%s fecha=%s estado=%s", ruta.id, ruta.fecha, ruta.estado)
 
-    for idx, (key, lista) in enumerate(
-        sorted(grupos.items(), key=lambda it: (str(it[0][0]), it[0][2] or "", it[0][1] or ""))
-    ):
-        _, _, _ = key
+    parada_rows: List[dict] = []
+    parada_pedido_rows: List[dict] = []
+    # orden de visita: (cliente_id, ciudad, dirección); la clave se calcula una vez por grupo
+    ordenados = [
+        ((str(cliente_id), ciudad_norm or "", direccion_norm or ""), lista)
+        for (cliente_id, direccion_norm, ciudad_norm), lista in grupos.items()
+    ]
+    ordenados.sort(key=itemgetter(0))
+    for idx, (_, lista) in enumerate(ordenados):
         _, cliente_original, direccion_original, ciudad_original = lista[0]
 
-        parada = Parada(
-            ruta_id=ruta.id,
-            cliente_id=cliente_original,
-            direccion=direccion_original,
-            ciudad=ciudad_original,
-            orden=idx + 1,
-            estado=ParadaEstado.PENDIENTE,
+        parada_id = uuid.uuid4()
+        parada_rows.append({
+            "id": parada_id,
+            "ruta_id": ruta.id,
+            "cliente_id": cliente_original,
+            "direccion": direccion_original,
+            "ciudad": ciudad_original,
+            "orden": idx + 1,
+            "estado": ParadaEstado.PENDIENTE,
+        })
+        parada_pedido_rows.extend(
+            {"parada_id": parada_id, "pedido_id": pedido_id} for (pedido_id, _cli, _dir, _ciu) in lista
         )
-        session.add(parada)
-        session.flush()
         logger.debug(
-            "Parada creada: id=%s orden=%d cliente_id=%s ciudad=%s dir=%s pedidos=%d",
-            parada.id, parada.orden, parada.cliente_id, parada.ciudad, parada.direccion, len(lista)
+            "Parada preparada: id=%s orden=%d cliente_id=%s ciudad=%s dir=%s pedidos=%d",
+            parada_id, idx + 1, cliente_original, ciudad_original, direccion_original, len(lista)
         )
 
-        for (pedido_id, _cli, _dir, _ciu) in lista:
-            session.add(ParadaPedido(parada_id=parada.id, pedido_id=pedido_id))
+    if parada_rows:
+        session.execute(insert(Parada), parada_rows)
+        session.execute(insert(ParadaPedido), parada_pedido_rows)
 
     session.commit()
-    session.refresh(ruta)
+    _adjuntar_paradas(session, ruta, parada_rows, parada_pedido_rows)
     logger.info("Ruta confirmada en DB: id=%s paradas=%d", ruta.id, len(ruta.paradas))
 
-    # 5) Marcar cada pedido como DESPACHADO (uno a uno) — fuera de la transacción
-    all_ok = True
-    for ped in pedidos:
-        pid_raw = ped.get("id")
-        try:
-            pid_uuid: UUID = pid_raw if isinstance(pid_raw, uuid.UUID) else uuid.UUID(str(pid_raw))
-        except Exception as e:
-            logger.warning("No se marca DESPACHADO (id inválido) %r: %s", pid_raw, e)
-            continue
-        ok = _emit_pedido_despachado_event(pid_uuid, x_country, audit)
-        all_ok = all_ok and ok
-
-    if not all_ok:
+    # 5) Marcar cada pedido como DESPACHADO (en paralelo) — fuera de la transacción
+    if not _emit_pedidos_despachados_events(valid_pids, audit):
         logger.warning("Algunos pedidos no se marcaron DESPACHADO vía evento. ruta_id=%s",ruta.id,)
 
     logger.info("Generar ruta finalizado: ruta_id=%s", ruta.id)
     return ruta
 
 
+def _base_options():
+    """Opciones comunes: cualquier relación no cargada explícitamente falla al accederse."""
+    return (raiseload("*"),)
+
+
+def _ruta_con_paradas():
+    """Carga paradas y pedidos en 3 queries en total."""
+    return (*_base_options(), selectinload(RutaEntrega.paradas).selectinload(Parada.pedidos))
+
+
 def obtener_ruta(session: Session, ruta_id: UUID) -> RutaEntrega:
     logger.debug("Obtener ruta: ruta_id=%s", ruta_id)
-    ruta = session.get(RutaEntrega, ruta_id)
+    ruta = session.execute(
+        select(RutaEntrega).where(RutaEntrega.id == ruta_id).options(*_ruta_con_paradas())
+    ).scalar_one_or_none()
     if not ruta:
         logger.info("Ruta no encontrada: ruta_id=%s -> 404", ruta_id)
         raise NotFoundError("Ruta no encontrada")
-    _ = [p.pedidos for p in ruta.paradas]
     return ruta
 
 
-def listar_rutas_por_fecha(session: Session, fecha: date) -> List[RutaEntrega]:
-    logger.debug("Listar rutas por fecha: fecha=%s", fecha)
-    rutas = session.execute(
-        select(RutaEntrega).where(RutaEntrega.fecha == fecha)
-    ).scalars().all()
-    for r in rutas:
-        _ = [p.pedidos for p in r.paradas]
+def listar_rutas_por_fecha(session: Session, fecha: date, *, include_paradas: bool = True) -> List[RutaEntrega]:
+    """
+    Rutas de `fecha`. Con `include_paradas` carga también sus paradas; los pedidos
+    de cada parada NO se cargan: se obtienen a la vez con `pedidos_por_parada`.
+    """
+    logger.debug("Listar rutas por fecha: fecha=%s include_paradas=%s", fecha, include_paradas)
+    stmt = select(RutaEntrega).where(RutaEntrega.fecha == fecha)
+    if include_paradas:
+        stmt = stmt.options(*_base_options(), selectinload(RutaEntrega.paradas).raiseload(Parada.pedidos))
+    else:
+        stmt = stmt.options(*_base_options())
+    rutas = session.execute(stmt).scalars().all()
     logger.info("Listar rutas: fecha=%s -> %d rutas", fecha, len(rutas))
     return rutas
 
 
-def actualizar_estado_parada(session: Session, parada_id: UUID, nuevo_estado: ParadaEstado) -> Parada:
-    logger.info("Actualizar estado parada: parada_id=%s nuevo_estado=%s", parada_id, nuevo_estado)
-    pa: Parada = session.get(Parada, parada_id)
+def pedidos_por_parada(session: Session, parada_ids: List[UUID]) -> Dict[UUID, List[UUID]]:
+    """Pedidos vinculados a cada parada, en un único SELECT ... IN sin hidratar ParadaPedido."""
+    by_parada: Dict[UUID, List[UUID]] = defaultdict(list)
+    if not parada_ids:
+        return by_parada
+    rows = session.execute(
+        select(ParadaPedido.parada_id, ParadaPedido.pedido_id).where(ParadaPedido.parada_id.in_(parada_ids))
+    ).all()
+    for parada_id, pedido_id in rows:
+        by_parada[parada_id].append(pedido_id)
+    return by_parada
+
+
+def _aplicar_estado_parada(session: Session, parada_id: UUID, nuevo_estado: ParadaEstado) -> Tuple[Parada, RutaEntrega]:
+    """
+    Cambia el estado de la parada y recalcula el de su ruta (EN_RUTA / FINALIZADA).
+    Solo hace flush: el commit queda a cargo del caso de uso.
+    """
+    pa: Parada = session.get(Parada, parada_id, options=[*_base_options(), selectinload(Parada.pedidos)])
     if not pa:
         logger.info("Parada no encontrada: parada_id=%s -> 404", parada_id)
         raise NotFoundError("Parada no encontrada")
 
-    ruta = session.get(RutaEntrega, pa.ruta_id)
+    ruta = session.get(RutaEntrega, pa.ruta_id, options=_base_options())
     if not ruta:
         logger.info(
             "Ruta no encontrada para parada: parada_id=%s ruta_id=%s -> 404",
@@ -319,11 +504,21 @@ def actualizar_estado_parada(session: Session, parada_id: UUID, nuevo_estado: Pa
 
     session.flush()
 
-    estados = [p.estado for p in ruta.paradas]
-    if estados and all(st == ParadaEstado.ENTREGADA for st in estados):
+    # agregado en SQL: no hidrata las paradas de la ruta
+    pendientes = session.execute(
+        select(func.count())
+        .select_from(Parada)
+        .where(Parada.ruta_id == ruta.id, Parada.estado != ParadaEstado.ENTREGADA)
+    ).scalar_one()
+    if pendientes == 0:
         logger.info("Todas las paradas ENTREGADAS -> Ruta %s FINALIZADA", ruta.id)
         ruta.estado = RutaEstado.FINALIZADA
         session.add(ruta)
+    return pa, ruta
+
+def actualizar_estado_parada(session: Session, parada_id: UUID, nuevo_estado: ParadaEstado) -> Parada:
+    logger.info("Actualizar estado parada: parada_id=%s nuevo_estado=%s", parada_id, nuevo_estado)
+    pa, ruta = _aplicar_estado_parada(session, parada_id, nuevo_estado)
 
     session.commit()
     session.refresh(pa)
@@ -332,3 +527,22 @@ def actualizar_estado_parada(session: Session, parada_id: UUID, nuevo_estado: Pa
         pa.id, pa.estado, ruta.id, ruta.estado
     )
     return pa
+
+def actualizar_estado_paradas(session: Session, cambios: List[Tuple[UUID, ParadaEstado]]) -> List[Parada]:
+    """
+    Aplica varios cambios de estado en orden y en un único commit.
+    Si alguna parada no existe no se aplica ninguno (rollback + 404).
+    """
+    logger.info("Actualizar estado de %d paradas", len(cambios))
+    paradas: List[Parada] = []
+    try:
+        for parada_id, nuevo_estado in cambios:
+            pa, _ = _aplicar_estado_parada(session, parada_id, nuevo_estado)
+            paradas.append(pa)
+    except Exception:
+        session.rollback()
+        raise
+
+    session.commit()
+    logger.info("Actualizar estado de %d paradas OK", len(paradas))
+    return paradas
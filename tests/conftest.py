@@ -1,5 +1,9 @@
 # tests/conftest.py
+import functools
+from contextlib import contextmanager
+import socket
 import uuid
+from datetime import date
 import pytest
 from typing import Iterator, Optional, Dict, Any
 
@@ -7,8 +11,8 @@ from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from fastapi.testclient import TestClient
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, raiseload
 from sqlalchemy.pool import StaticPool  # <-- clave para compartir la conexión en memoria
 
 # Importa modelos para registrar todas las tablas ANTES de create_all
@@ -18,6 +22,7 @@ from src.errors import NotFoundError, ConflictError
 from src.dependencies import AuditContext
 
 # Router real
+import src.routes.logistica as logistica_route_mod
 from src.routes.logistica import router as logistica_router
 
 # Servicio a parchear (para inyectar MsClient fake)
@@ -25,14 +30,15 @@ from src.services import logistica_service
 
 
 # -----------------------------
-# DB SQLite en memoria (aislada por test, 1 conexión compartida)
+# DB SQLite en memoria (1 engine por sesión de pytest, rollback por test)
 # -----------------------------
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def engine_sqlite():
     """
-    Crea un engine SQLite en memoria *por test*,
-    usando StaticPool para que *todas las sesiones del test*
-    compartan la MISMA conexión (y por tanto la misma BD en memoria).
+    Crea un engine SQLite en memoria *una vez por sesión de pytest*,
+    usando StaticPool para que todas las conexiones compartan la MISMA
+    BD en memoria. El DDL (create_all) se ejecuta una sola vez; cada test
+    deshace solo su DML con rollback (ver db_session).
     """
     engine = create_engine(
         "sqlite+pysqlite://",                # ¡sin :memory: explícito!
@@ -40,6 +46,17 @@ def engine_sqlite():
         poolclass=StaticPool,                # <- reutiliza siempre la misma conexión
         future=True,
     )
+
+    # pysqlite no emite BEGIN ni maneja SAVEPOINT por sí solo: se desactiva su
+    # manejo de transacciones y se emite BEGIN explícito (receta de SQLAlchemy).
+    @event.listens_for(engine, "connect")
+    def _do_connect(dbapi_connection, _):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
     # Asegúrate de que todas las tablas estén registradas en Base.metadata
     Base.metadata.create_all(bind=engine)
     try:
@@ -52,37 +69,82 @@ def engine_sqlite():
 @pytest.fixture()
 def db_session(engine_sqlite) -> Iterator:
     """
-    Sesión ligada al engine del test.
+    Sesión ligada a una transacción externa que se revierte al final del test.
+    Los commit() del servicio solo liberan SAVEPOINTs
+    (join_transaction_mode="create_savepoint"), así que nada sobrevive al test.
     """
-    SessionLocal = sessionmaker(
-        bind=engine_sqlite,
+    conn = engine_sqlite.connect()
+    trans = conn.begin()
+    session = Session(
+        bind=conn,
         autoflush=False,
-        autocommit=False,
         expire_on_commit=False,
-        future=True,
+        join_transaction_mode="create_savepoint",
     )
-    with SessionLocal() as s:
-        yield s
-        # No es necesario rollback aquí; la BD se destruye al final del test
+    try:
+        yield session
+    finally:
+        session.close()
+        trans.rollback()
+        conn.close()
+
+
+# -----------------------------
+# Helpers compartidos
+# -----------------------------
+@functools.lru_cache(maxsize=None)
+def build_pedidos_params(fecha="2025-10-24", tipo="VENTA", limit="200", offset="0"):
+    """Params (tupla ordenada) que el servicio envía a GET /v1/pedidos."""
+    return tuple(sorted([("tipo",tipo),("estado","APROBADO"),("fecha_compromiso",fecha),("limit",limit),("offset",offset)]))
+
+
+DEFAULT_PEDIDOS_PARAMS = build_pedidos_params()
+
+
+@pytest.fixture()
+def audit() -> AuditContext:
+    return AuditContext(request_id=uuid.uuid4().hex, country="co", user_id=None, ip="127.0.0.1")
 
 
 # -----------------------------
 # MsClient Fake (sin red)
 # -----------------------------
-class FakeMsClient:
+class FakeMsState:
     """
-    Fake muy simple. Usa 'fixtures' para decidir respuestas.
+    Respuestas canned del FakeMsClient (compartidas por todos los clientes del test).
+
+      - set_pedidos(payload)          -> respuesta de cualquier GET .../v1/pedidos
+      - set_pedidos(payload, params)  -> respuesta solo para esos params (tupla ordenada)
+      - set_usuarios(mapping)         -> dict[int, {"direccion"|"address", "ciudad"|"city"}]
+      - marcar_falla                  -> set[str] de IDs que fallan en POST .../marcar-despachado
+      - pedidos_calls                 -> params de cada GET .../v1/pedidos (para asserts)
+      - usuarios_calls                -> cliente_id de cada GET .../v1/usuarios/usuario/{id}
+    """
+    def __init__(self):
+        self.pedidos: Any = []
+        self.pedidos_por_params: Dict[tuple, Any] = {}
+        self.usuarios: Dict[int, Dict[str, Any]] = {}
+        self.marcar_falla: set = set()
+        self.pedidos_calls: list = []
+        self.usuarios_calls: list = []
+
+    def set_pedidos(self, payload: Any, params: Optional[tuple] = None) -> None:
+        if params is None:
+            self.pedidos = payload
+        else:
+            self.pedidos_por_params[params] = payload
 
-    Claves soportadas en fixtures:
-      - ('pedidos', <params_tuple>) -> list[dict]  # respuesta exacta para GET .../v1/pedidos con esos params
-      - 'pedidos_default' -> list[dict]            # fallback si no hay match por params
-      - 'pedidos' -> list[dict]                    # fallback más general
-      - 'usuarios' -> dict[int, {"direccion"|"address": str|None, "ciudad"|"city": str|None}]
-      - 'marcar_falla' -> set[str]                 # IDs que fallan en POST .../v1/pedidos/{id}/marcar-despachado
+    def set_usuarios(self, mapping: Dict[int, Dict[str, Any]]) -> None:
+        self.usuarios = mapping
+
+
+class FakeMsClient:
+    """
+    Fake muy simple: responde desde un FakeMsState (sin red).
     """
-    def __init__(self, x_country: str, fixtures: Optional[Dict[str, Any]] = None):
+    def __init__(self, x_country: str, state: Optional[FakeMsState] = None):
         self.x_country = x_country
-        self.fixtures = fixtures or {}
+        self.state = state or FakeMsState()
 
     # ---------------- path matching helpers ----------------
     def _is_pedidos_path(self, path: str) -> bool:
@@ -100,18 +162,18 @@ class FakeMsClient:
     # ---------------- HTTP methods ----------------
     def get(self, path: str, params: Optional[Dict[str, Any]] = None):
         if self._is_pedidos_path(path):
-            # intenta match exacto por params (ordenados)
-            key = ("pedidos", tuple(sorted((params or {}).items())))
-            if key in self.fixtures:
-                return self.fixtures[key]
-            # fallbacks
-            if "pedidos_default" in self.fixtures:
-                return self.fixtures["pedidos_default"]
-            return self.fixtures.get("pedidos", [])
+            self.state.pedidos_calls.append(dict(params or {}))
+            # match por params solo si el test registró respuestas por página
+            if self.state.pedidos_por_params:
+                key = tuple(sorted((params or {}).items()))
+                if key in self.state.pedidos_por_params:
+                    return self.state.pedidos_por_params[key]
+            return self.state.pedidos
 
         if self._is_usuario_detalle_path(path):
             cid = self._extract_cliente_id(path)
-            raw = self.fixtures.get("usuarios", {}).get(cid, {})
+            self.state.usuarios_calls.append(cid)
+            raw = self.state.usuarios.get(cid, {})
             # tolera tanto {'direccion','ciudad'} como {'address','city'}
             return {
                 "direccion": raw.get("direccion") or raw.get("address"),
@@ -125,45 +187,107 @@ class FakeMsClient:
         if p.endswith("/marcar-despachado") and "/v1/pedidos/" in p:
             # .../v1/pedidos/{id}/marcar-despachado
             pid = path.split("/")[3]
-            fails = self.fixtures.get("marcar_falla", set())
-            if pid in fails:
+            if pid in self.state.marcar_falla:
                 raise RuntimeError("Fallo intencional marcar-despachado")
             return {"status": "ok"}
         raise ValueError(f"[FakeMsClient] POST no mockeado: {path}")
 
 
 
-@pytest.fixture()
-def ms_fixtures() -> Dict[str, Any]:
-    return {}
+@pytest.fixture(autouse=True)
+def _no_network(monkeypatch):
+    """
+    Ningún test sale a la red: cualquier `connect` no mockeado (p.ej. un
+    MsClient real que se escapó de patch_msclient) falla de inmediato en vez
+    de quedarse esperando DNS/TCP.
+    """
+    def _boom(*_args, **_kwargs):
+        raise RuntimeError("Conexión de red bloqueada en tests")
+
+    monkeypatch.setattr(socket.socket, "connect", _boom)
+    monkeypatch.setattr(socket.socket, "connect_ex", _boom)
+
+
+@pytest.fixture(autouse=True)
+def _no_lazy(monkeypatch):
+    """
+    Todo `Session.get` carga con raiseload('*'): si el servicio accede a una
+    relación que no pidió explícitamente (N+1 accidental), el test falla con
+    InvalidRequestError.
+    """
+    original_get = Session.get
+
+    def _get(self, entity, ident, *args, options=None, **kwargs):
+        return original_get(self, entity, ident, *args, options=[raiseload("*"), *(options or ())], **kwargs)
+
+    monkeypatch.setattr(Session, "get", _get)
+
+
+@pytest.fixture(autouse=True)
+def _clear_process_caches():
+    """
+    Las cachés de proceso (ms-usuarios, MsClient por país, respuestas de rutas)
+    sobreviven entre tests; se vacían para que cada test vea solo sus fixtures.
+    """
+    caches = (
+        logistica_service._CLIENTES_CACHE, logistica_service._MS_CLIENTS,
+        logistica_route_mod._RUTA_BLOBS, logistica_route_mod._RUTA_GENERACION,
+    )
+    for cache in caches:
+        cache.clear()
+    yield
+    for cache in caches:
+        cache.clear()
 
 
 @pytest.fixture()
-def patch_msclient(monkeypatch, ms_fixtures):
+def patch_msclient(monkeypatch) -> FakeMsState:
     """
     Reemplaza MsClient dentro del servicio por el FakeMsClient.
+    Devuelve el FakeMsState para configurar respuestas (set_pedidos / set_usuarios).
     """
+    state = FakeMsState()
+
     def _factory(x_country: str):
-        return FakeMsClient(x_country=x_country, fixtures=ms_fixtures)
+        return FakeMsClient(x_country=x_country, state=state)
 
     monkeypatch.setattr(logistica_service, "MsClient", lambda x_country: _factory(x_country))
-    return ms_fixtures
+    return state
+
+
+@pytest.fixture()
+def usuarios(patch_msclient) -> Dict[int, Dict[str, Any]]:
+    """
+    Clientes por defecto de ms-usuarios. Los tests que necesiten datos propios
+    modifican el dict devuelto (el fake lo lee en cada GET).
+    """
+    base = {
+        1: {"direccion": "DirA", "ciudad": "Bogotá"},
+        2: {"direccion": "DirB", "ciudad": "Bogotá"},
+        10: {"direccion": "Cra 10 # 1-1", "ciudad": "Bogotá"},
+        99: {"direccion": "Calle 1", "ciudad": "Bogotá"},
+        101: {"direccion": "Calle 123 #45-67", "ciudad": "Bogotá"},
+        201: {"direccion": "Calle 1", "ciudad": "Cali"},
+    }
+    patch_msclient.set_usuarios(base)
+    return base
 
 
 # -----------------------------
 # App FastAPI de integración
 # -----------------------------
-@pytest.fixture()
-def test_app(db_session, monkeypatch) -> TestClient:
+@pytest.fixture(scope="session")
+def _app_client() -> Iterator[tuple]:
     """
-    Crea una app de pruebas que usa:
+    App de pruebas construida *una vez por sesión de pytest*:
       - el router real de logística
       - handlers de NotFound/Conflict
       - overrides de get_session y audit_context
-    La sesión inyectada (db_session) está ligada al engine con StaticPool,
-    por lo que las tablas creadas son visibles en cada request del test.
+    get_session / session_for_schema entregan la sesión del test en curso, que
+    test_app deja en `holder`; el aislamiento lo da el rollback de db_session.
     """
     app = FastAPI(title="ms-logistica (tests)")
+    holder: Dict[str, Any] = {"session": None}
 
     @app.exception_handler(NotFoundError)
     async def _nf(_: Request, exc: NotFoundError):
@@ -173,12 +297,22 @@ def test_app(db_session, monkeypatch) -> TestClient:
     async def _cf(_: Request, exc: ConflictError):
         return JSONResponse(status_code=409, content={"detail": str(exc)})
 
-    # Overrides de dependencias del router
-    import src.routes.logistica as logistica_route_mod
+    # Overrides de dependencias del router: get_session y session_for_schema
+    # (los handlers que abren su sesión) entregan la sesión del test en curso
+    def _current_session():
+        session = holder["session"]
+        if session is None:
+            raise RuntimeError("test_app usado sin db_session activa")
+        return session
 
     def _override_get_session():
-        # YIELD la *misma* sesión ligada al engine del test
-        yield db_session
+        yield _current_session()
+
+    @contextmanager
+    def _session_for_schema(_schema: str):
+        yield _current_session()
+
+    holder["session_for_schema"] = _session_for_schema
 
     def _override_audit_context(_: Request = None):
         return AuditContext(
@@ -193,4 +327,33 @@ def test_app(db_session, monkeypatch) -> TestClient:
 
     app.include_router(logistica_router)
 
-    return TestClient(app)
+    with TestClient(app) as client:
+        yield client, holder
+
+
+@pytest.fixture()
+def test_app(_app_client, db_session, monkeypatch) -> Iterator[TestClient]:
+    """TestClient compartido, apuntando a la sesión (db_session) de este test."""
+    client, holder = _app_client
+    holder["session"] = db_session
+    monkeypatch.setattr(logistica_route_mod, "session_for_schema", holder["session_for_schema"])
+    try:
+        yield client
+    finally:
+        holder["session"] = None
+
+
+# -----------------------------
+# Ruta ya generada (tests de transición de estados)
+# -----------------------------
+@pytest.fixture()
+def generated_ruta(db_session, patch_msclient, usuarios, audit):
+    """
+    Ruta del 2025-10-24 en estado PLANEADA con dos paradas (clientes 1 y 2),
+    un pedido cada una; orden 1 = cliente 1.
+    """
+    patch_msclient.set_pedidos([
+        {"id": str(uuid.uuid4()), "cliente_id": 1, "tipo": "VENTA", "estado": "APROBADO"},
+        {"id": str(uuid.uuid4()), "cliente_id": 2, "tipo": "VENTA", "estado": "APROBADO"},
+    ])
+    return logistica_service.generar_ruta(db_session, date(2025, 10, 24), audit, tipo="VENTA")
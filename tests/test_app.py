@@ -0,0 +1,100 @@
+# tests/test_app.py
+import pytest
+from sqlalchemy import create_engine, delete, inspect, insert, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import StaticPool
+
+import src.app as app_mod
+from src.domain import models
+
+pytestmark = pytest.mark.xdist_group("db")
+
+# SQLite expone su BD principal como el schema "main": sirve de schema traducido
+SCHEMA = "main"
+
+
+@pytest.fixture()
+def init_engine(monkeypatch):
+    """
+    Engine SQLite propio (no el compartido de db_session) para ejecutar el DDL de
+    arranque. Los ALTER ... SET DEFAULT son solo de PostgreSQL: se registran en
+    vez de ejecutarse (ver test_server_default_ddl_postgresql).
+    """
+    engine = create_engine("sqlite+pysqlite://", poolclass=StaticPool, future=True)
+    ddl_calls = []
+    monkeypatch.setattr(app_mod, "engine", engine)
+    monkeypatch.setattr(app_mod, "_server_default_ddl", lambda schema, dialect: ddl_calls.append(schema) or [])
+    try:
+        yield engine, ddl_calls
+    finally:
+        engine.dispose()
+
+
+def _versiones(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(models.SchemaReady.version)).scalars().all()
+
+
+def test_init_schema_crea_tablas_indices_y_marca_version(init_engine):
+    engine, ddl_calls = init_engine
+    app_mod._init_schema(SCHEMA)
+
+    insp = inspect(engine)
+    assert {"_schema_ready", "ruta_entrega", "parada", "parada_pedido"} <= set(insp.get_table_names())
+    assert "ix_ruta_entrega_fecha_estado" in {ix["name"] for ix in insp.get_indexes("ruta_entrega")}
+    assert "ix_parada_ruta_id" in {ix["name"] for ix in insp.get_indexes("parada")}
+    assert ddl_calls == [SCHEMA]
+    assert _versiones(engine) == [models.SCHEMA_VERSION]
+
+
+def test_init_schema_version_al_dia_no_ejecuta_ddl(init_engine, monkeypatch):
+    engine, ddl_calls = init_engine
+    app_mod._init_schema(SCHEMA)
+
+    def _no_ddl(*_a, **_kw):
+        raise AssertionError("con la versión al día no debe haber DDL")
+    monkeypatch.setattr(models.Base.metadata, "create_all", _no_ddl)
+    app_mod._init_schema(SCHEMA)
+    assert ddl_calls == [SCHEMA]  # solo el primer arranque
+    assert _versiones(engine) == [models.SCHEMA_VERSION]
+
+
+def test_init_schema_version_vieja_recrea_indices_y_reestampa(init_engine):
+    engine, ddl_calls = init_engine
+    app_mod._init_schema(SCHEMA)
+    # schema de una versión anterior: sin el índice nuevo y con marcas viejas
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_parada_ruta_id"))
+        conn.execute(delete(models.SchemaReady))
+        conn.execute(insert(models.SchemaReady), [{"version": 1}, {"version": models.SCHEMA_VERSION - 1}])
+
+    app_mod._init_schema(SCHEMA)
+    assert "ix_parada_ruta_id" in {ix["name"] for ix in inspect(engine).get_indexes("parada")}
+    assert ddl_calls == [SCHEMA, SCHEMA]
+    assert _versiones(engine) == [models.SCHEMA_VERSION]
+
+
+def test_server_default_ddl_postgresql():
+    stmts = app_mod._server_default_ddl("co", postgresql.dialect())
+    assert sorted(stmts) == [
+        """ALTER TABLE "co"."parada" ALTER COLUMN "creado_en" SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP)""",
+        """ALTER TABLE "co"."ruta_entrega" ALTER COLUMN "creado_en" SET DEFAULT TIMEZONE('utc', CURRENT_TIMESTAMP)""",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_lifespan_inicializa_todos_los_schemas_aunque_uno_falle(monkeypatch, caplog):
+    vistos, cerrado = [], []
+
+    def _init(schema):
+        vistos.append(schema)
+        if schema == "ec":
+            raise RuntimeError("sin permisos")
+    monkeypatch.setattr(app_mod, "_init_schema", _init)
+    monkeypatch.setattr(app_mod, "close_ms_clients", lambda: cerrado.append(True))
+
+    async with app_mod.lifespan(app_mod.app):
+        assert sorted(vistos) == sorted(app_mod.KNOWN_SCHEMAS)
+        assert "Error creando tablas en schema ec: sin permisos" in caplog.text
+        assert cerrado == []
+    assert cerrado == [True]
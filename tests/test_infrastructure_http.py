@@ -1,59 +1,58 @@
 import pytest
+from src.config import settings
 from src.infrastructure.http import MsClient
-from src.infrastructure.infrastructure import publish_event
+from src.infrastructure.infrastructure import publish_event, publish_events_batch
 import json
+import time
+from concurrent.futures import Future
 from uuid import uuid4
 
+pytestmark = pytest.mark.xdist_group("http")
 
-class DummyResponse:
-    def __init__(self, status_code=200, json_body=None, text="OK", url=""):
-        self.status_code = status_code
-        self._json = {} if json_body is None else json_body
-        self.text = text
-        self.url = url
-        self.request = type("R", (), {"method": "GET"})()
 
-    @property
-    def content(self):
-        # Simula contenido para .json()
-        return b"{}" if self._json is not None else b""
+def test_msclient_get_ok(requests_mock, monkeypatch):
+    # setea base URL del gateway; requests_mock intercepta el transporte de requests
+    monkeypatch.setattr("src.config.settings.GATEWAY_BASE_URL", "https://api.example.com", raising=False)
+    requests_mock.get("https://api.example.com/v1/ping", json={"pong": True})
 
-    def json(self):
-        return self._json
+    c = MsClient(x_country="co")
+    out = c.get("/v1/ping", params={"a": "1"})
+    assert out == {"pong": True}
+    req = requests_mock.last_request
+    assert req.url == "https://api.example.com/v1/ping?a=1"
+    assert req.headers["X-Country"] == "co"
+    assert req.headers["Content-Type"] == "application/json"
+    assert req.qs == {"a": ["1"]}
 
 
-def test_msclient_get_ok(monkeypatch):
-    sent = {}
+def test_msclient_comparte_session_con_pool():
+    co, pe = MsClient(x_country="co"), MsClient(x_country="pe")
+    assert co.session is pe.session is MsClient._session
 
-    def fake_get(url, headers=None, params=None, timeout=None):
-        sent["url"] = url
-        sent["headers"] = headers
-        sent["params"] = params
-        r = DummyResponse(200, {"pong": True}, url=url)
-        r.request = type("R", (), {"method": "GET"})()
-        return r
+    adapter = MsClient._session.get_adapter("https://gw.example/v1/pedidos")
+    assert adapter._pool_maxsize == settings.MS_HTTP_POOL_MAXSIZE
+    assert adapter.max_retries.total == settings.MS_HTTP_RETRIES
+    assert "POST" not in adapter.max_retries.allowed_methods
 
-    # setea base URL del gateway y parchea requests.get
-    monkeypatch.setattr("src.config.settings.GATEWAY_BASE_URL", "https://api.example.com", raising=False)
-    monkeypatch.setattr("requests.get", fake_get, raising=False)
 
-    c = MsClient(x_country="co")
-    out = c.get("/v1/ping", params={"a": "1"})
-    assert out == {"pong": True}
-    assert sent["url"] == "https://api.example.com/v1/ping"
-    assert sent["headers"]["X-Country"] == "co"
-    assert sent["headers"]["Content-Type"] == "application/json"
-    assert sent["params"] == {"a": "1"}
+def test_msclient_post_ok_envia_json(requests_mock, monkeypatch):
+    monkeypatch.setattr("src.config.settings.GATEWAY_BASE_URL", "https://gw.example", raising=False)
+    requests_mock.post("https://gw.example/v1/echo", json={"ok": True})
 
+    c = MsClient(x_country="mx")
+    out = c.post("/v1/echo", json={"nombre": "Bogotá", "n": 1})
+    assert out == {"ok": True}
+    req = requests_mock.last_request
+    assert req.headers["Content-Type"] == "application/json"
+    assert req.json() == {"nombre": "Bogotá", "n": 1}
 
-def test_msclient_post_error_levanta(monkeypatch):
-    def fake_post(url, headers=None, json=None, params=None, timeout=None):
-        r = DummyResponse(500, {"error": "boom"}, text="Internal Server Error", url=url)
-        r.request = type("R", (), {"method": "POST"})()
-        return r
 
+def test_msclient_post_error_levanta(requests_mock, monkeypatch):
     monkeypatch.setattr("src.config.settings.GATEWAY_BASE_URL", "https://gw.example", raising=False)
-    monkeypatch.setattr("requests.post", fake_post, raising=False)
+    requests_mock.post(
+        "https://gw.example/v1/pedidos/ID/marcar-despachado",
+        status_code=500, text="Internal Server Error",
+    )
 
     c = MsClient(x_country="pe")
     with pytest.raises(Exception) as exc:
@@ -94,6 +93,64 @@ def test_publish_event_ok(monkeypatch):
     assert decoded == data
 
 
+def test_publish_events_batch_ok(monkeypatch):
+    import src.infrastructure.infrastructure as infra
+
+    class DummyPublisher:
+        def __init__(self):
+            self.calls = []
+        def publish(self, topic, payload):
+            self.calls.append((topic, payload))
+            fut = Future()
+            fut.set_result(f"msg-{len(self.calls)}")
+            return fut
+
+    dummy = DummyPublisher()
+    monkeypatch.setattr(infra, "get_publisher", lambda: dummy)
+
+    topic = f"projects/test/topics/{uuid4()}"
+    items = [{"n": i} for i in range(100)]
+
+    out = publish_events_batch(items, topic)
+
+    assert out == [f"msg-{i}" for i in range(1, 101)]
+    assert [json.loads(p) for _, p in dummy.calls] == items
+
+
+def test_publish_events_batch_propaga_rechazo(monkeypatch):
+    import src.infrastructure.infrastructure as infra
+
+    class RejectingPublisher:
+        def publish(self, topic, payload):
+            fut = Future()
+            if json.loads(payload)["n"] == 1:
+                fut.set_exception(ValueError("rechazado"))
+            else:
+                fut.set_result("ok")
+            return fut
+
+    monkeypatch.setattr(infra, "get_publisher", lambda: RejectingPublisher())
+
+    with pytest.raises(ValueError):
+        publish_events_batch([{"n": i} for i in range(3)], "projects/test/topics/x")
+
+
+def test_publish_events_batch_timeout_es_del_lote(monkeypatch):
+    import src.infrastructure.infrastructure as infra
+
+    class StalledPublisher:
+        def publish(self, topic, payload):
+            return Future()  # Pub/Sub no responde
+
+    monkeypatch.setattr(infra, "get_publisher", lambda: StalledPublisher())
+
+    inicio = time.monotonic()
+    # un único plazo para los 50, no 50 × 0.1 s
+    with pytest.raises(TimeoutError):
+        publish_events_batch([{"n": i} for i in range(50)], "projects/test/topics/x", timeout=0.1)
+    assert time.monotonic() - inicio < 1
+
+
 def test_publish_event_propagates_error(monkeypatch):
     import src.infrastructure.infrastructure as infra
 
@@ -104,4 +161,25 @@ def test_publish_event_propagates_error(monkeypatch):
     monkeypatch.setattr(infra, "get_publisher", lambda: BoomPublisher())
 
     with pytest.raises(RuntimeError):
-        publish_event({"x": 1}, "projects/test/topics/x")
\ No newline at end of file
+        publish_event({"x": 1}, "projects/test/topics/x")
+
+
+def test_get_publisher_usa_batch_settings(monkeypatch):
+    import src.infrastructure.infrastructure as infra
+
+    class FakePublisherClient:
+        def __init__(self, batch_settings=None):
+            self.batch_settings = batch_settings
+
+    monkeypatch.setattr(infra.pubsub_v1, "PublisherClient", FakePublisherClient)
+    monkeypatch.setattr("src.config.settings.PUBSUB_BATCH_MAX_MESSAGES", 64)
+    monkeypatch.setattr("src.config.settings.PUBSUB_BATCH_MAX_BYTES", 2048)
+    monkeypatch.setattr("src.config.settings.PUBSUB_BATCH_MAX_LATENCY_SEC", 0.05)
+    infra.get_publisher.cache_clear()
+    try:
+        pub = infra.get_publisher()
+        assert infra.get_publisher() is pub  # singleton por proceso
+        bs = pub.batch_settings
+        assert (bs.max_messages, bs.max_bytes, bs.max_latency) == (64, 2048, 0.05)
+    finally:
+        infra.get_publisher.cache_clear()
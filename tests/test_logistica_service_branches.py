@@ -1,3 +1,4 @@
+import threading
 import uuid
 import pytest
 from datetime import date
@@ -5,52 +6,46 @@ from datetime import date
 from src.services import logistica_service
 from src.errors import NotFoundError, ConflictError
 from src.domain.models import RutaEstado, ParadaEstado
+from conftest import DEFAULT_PEDIDOS_PARAMS, build_pedidos_params as _params
 
-# ---- helpers ----
-class A:  # audit fake
-    def __init__(self, country="co"): self.country=country
+pytestmark = pytest.mark.xdist_group("db")
 
-def _params(fecha="2025-10-24", tipo="VENTA", limit="200", offset="0"):
-    return tuple(sorted([("tipo",tipo),("estado","APROBADO"),("fecha_compromiso",fecha),("limit",limit),("offset",offset)]))
+# 1-3) Forma de la respuesta de ms-pedidos: dict con 'items', tipo inesperado o vacía
+_SIN_PEDIDOS_MSG = "No hay ventas para generar ruta de entrega en la fecha seleccionada."
 
-# 1) _ms_pedidos_listar_aprobados devuelve dict con 'items'
-def test_ms_pedidos_dict_items(db_session, patch_msclient, monkeypatch):
-    patch_msclient[("pedidos", _params())] = {"items": [
-        {"id": str(uuid.uuid4()), "cliente_id": 99, "tipo":"VENTA","estado":"APROBADO"}
-    ]}
-    patch_msclient["usuarios"] = {99: {"address":"Calle 1", "city":"Bogotá"}}
+@pytest.mark.parametrize("payload,expected", [
+    pytest.param(
+        {"items": [{"id": str(uuid.uuid4()), "cliente_id": 99, "tipo": "VENTA", "estado": "APROBADO"}]},
+        None, id="dict-items",
+    ),
+    pytest.param(123, NotFoundError, id="tipo-inesperado"),
+    pytest.param([], NotFoundError, id="sin-pedidos"),
+])
+def test_generar_ruta_variants(db_session, patch_msclient, usuarios, audit, payload, expected):
+    patch_msclient.set_pedidos(payload)
 
-    # fuerza MsClient de servicio a usar el fake ya inyectado en conftest
-    r = logistica_service.generar_ruta(db_session, date(2025,10,24), A(), tipo="VENTA")
+    if expected is not None:
+        with pytest.raises(expected) as exc:
+            logistica_service.generar_ruta(db_session, date(2025,10,24), audit, tipo="VENTA")
+        assert str(exc.value) == _SIN_PEDIDOS_MSG
+        return
+
+    r = logistica_service.generar_ruta(db_session, date(2025,10,24), audit, tipo="VENTA")
     assert r.estado == RutaEstado.PLANEADA
     assert len(r.paradas) == 1
+    assert [tuple(sorted(c.items())) for c in patch_msclient.pedidos_calls] == [DEFAULT_PEDIDOS_PARAMS]
     # cubrir listar_rutas_por_fecha
     rutas = logistica_service.listar_rutas_por_fecha(db_session, date(2025,10,24))
     assert len(rutas) == 1
 
-# 2) _ms_pedidos_listar_aprobados devuelve tipo inesperado -> []
-def test_ms_pedidos_tipo_inesperado_da_404(db_session, patch_msclient):
-    patch_msclient[("pedidos", _params())] = 123  # tipo inesperado
-    with pytest.raises(NotFoundError):
-        logistica_service.generar_ruta(db_session, date(2025,10,24), A(), tipo="VENTA")
-
-# 3) Sin pedidos -> 404 de negocio (mensaje exacto)
-def test_generar_ruta_sin_pedidos_404(db_session, patch_msclient):
-    patch_msclient[("pedidos", _params())] = []
-    with pytest.raises(NotFoundError) as exc:
-        logistica_service.generar_ruta(db_session, date(2025,10,24), A(), tipo="VENTA")
-    assert "No hay ventas para generar ruta de entrega en la fecha seleccionada" in str(exc.value)
-
 # 4) Conflicto por fecha duplicada
-def test_generar_ruta_conflicto_fecha(db_session, patch_msclient):
+def test_generar_ruta_conflicto_fecha(db_session, patch_msclient, usuarios, audit):
     pid = str(uuid.uuid4())
-    patch_msclient[("pedidos", _params())] = [{"id": pid, "cliente_id": 1, "tipo":"VENTA","estado":"APROBADO"}]
-    patch_msclient["usuarios"] = {1: {"address":"Dir A", "city":"Bogotá"}}
-    a = A()
-    r1 = logistica_service.generar_ruta(db_session, date(2025,10,24), a, tipo="VENTA")
+    patch_msclient.set_pedidos([{"id": pid, "cliente_id": 1, "tipo":"VENTA","estado":"APROBADO"}])
+    r1 = logistica_service.generar_ruta(db_session, date(2025,10,24), audit, tipo="VENTA")
     assert r1.id is not None
     with pytest.raises(ConflictError):
-        logistica_service.generar_ruta(db_session, date(2025,10,24), a, tipo="VENTA")
+        logistica_service.generar_ruta(db_session, date(2025,10,24), audit, tipo="VENTA")
 
 # 5) _ms_pedido_marcar_despachado reintenta y falla
 def test_marcar_despachado_reintenta_y_falla(monkeypatch):
@@ -60,30 +55,154 @@ def test_marcar_despachado_reintenta_y_falla(monkeypatch):
         def post(self, path, json=None, params=None):
             calls["n"] += 1
             raise RuntimeError("boom")
+    sleeps = []
     monkeypatch.setattr(logistica_service, "MsClient", FF)
+    monkeypatch.setattr(logistica_service.time, "sleep", sleeps.append)  # sin backoff real
     ok = logistica_service._ms_pedido_marcar_despachado(FF("co"), "x-id")
     assert ok is False
     assert calls["n"] == logistica_service.MAX_RETRIES
+    assert sleeps == [logistica_service.RETRY_SLEEP_SEC] * logistica_service.MAX_RETRIES
 
 # 6) actualizar_estado_parada: EN_RUTA → FINALIZADA
-def test_actualizar_estado_finaliza(db_session, patch_msclient):
-    p1, p2 = str(uuid.uuid4()), str(uuid.uuid4())
-    patch_msclient[("pedidos", _params())] = [
-        {"id": p1, "cliente_id": 10, "tipo":"VENTA","estado":"APROBADO"},
-        {"id": p2, "cliente_id": 10, "tipo":"VENTA","estado":"APROBADO"},
-    ]
-    patch_msclient["usuarios"] = {10: {"address":"Calle X", "city":"Cali"}}
-
-    r = logistica_service.generar_ruta(db_session, date(2025,10,24), A(), tipo="VENTA")
+def test_actualizar_estado_finaliza(db_session, generated_ruta):
+    r = generated_ruta
     assert r.estado == RutaEstado.PLANEADA
     pa = r.paradas[0]
     # primera entrega: ruta pasa a EN_RUTA
     pa1 = logistica_service.actualizar_estado_parada(db_session, pa.id, ParadaEstado.ENTREGADA)
     r_ref = db_session.get(type(r), r.id)
     assert r_ref.estado in (RutaEstado.EN_RUTA, RutaEstado.FINALIZADA)
-    # marca el resto de pedidos de la misma parada como entregada
-    # (si tienes varias paradas, repite para todas)
+    # entrega el resto de paradas
     for p in r_ref.paradas:
         logistica_service.actualizar_estado_parada(db_session, p.id, ParadaEstado.ENTREGADA)
     r_fin = db_session.get(type(r), r.id)
     assert r_fin.estado == RutaEstado.FINALIZADA
+
+# 7) eventos pedido_despachado: se publican sin esperar el ack; los fallos se loguean por pedido
+def test_emit_despachados_no_espera_confirmaciones(monkeypatch, audit, caplog):
+    from concurrent.futures import Future
+    futures = {}
+    def fake_publish(event, topic):
+        fut = futures[event["pedido_id"]] = Future()
+        return fut
+    monkeypatch.setattr(logistica_service.Settings, "TOPIC_PEDIDOS", "projects/p/topics/pedidos")
+    monkeypatch.setattr(logistica_service, "publish_event", fake_publish)
+
+    pids = [uuid.uuid4() for _ in range(3)]
+    # retorna aunque ningún future esté resuelto
+    assert logistica_service._emit_pedidos_despachados_events(pids, audit) is True
+    assert all(not f.done() for f in futures.values())
+
+    futures[str(pids[0])].set_result("msg-1")
+    futures[str(pids[1])].set_exception(TimeoutError("sin ack"))
+    errores = " ".join(r.getMessage() for r in caplog.records if r.levelname == "ERROR")
+    assert f"pedido_id={pids[1]}" in errores
+    assert f"pedido_id={pids[0]}" not in errores
+
+# 8) ms-usuarios: la caché de proceso evita repetir la consulta entre requests
+def test_usuarios_cache_entre_requests():
+    calls = {"n": 0}
+    class MS:
+        x_country = "co"
+        def get(self, path, params=None):
+            calls["n"] += 1
+            return {"address": "Calle 1", "city": "Cali"}
+    ms = MS()
+    primero = logistica_service._ms_usuarios_detalle(ms, 7, {})
+    segundo = logistica_service._ms_usuarios_detalle(ms, 7, {})  # otro request: caché vacía
+    assert primero is segundo
+    assert (primero["direccion"], primero["ciudad"]) == ("Calle 1", "Cali")
+    assert calls["n"] == 1
+
+def test_usuarios_prefetch_sin_pool_si_todo_esta_en_cache(monkeypatch):
+    class MS:
+        x_country = "co"
+        def get(self, path, params=None):
+            return {"address": "Calle 1", "city": "Cali"}
+    ms = MS()
+    for cid in (7, 8):
+        logistica_service._ms_usuarios_detalle(ms, cid, {})
+
+    def _sin_pool(*_a, **_kw):
+        raise AssertionError("no debió crear el pool: todos los clientes estaban en caché")
+    monkeypatch.setattr(logistica_service, "ThreadPoolExecutor", _sin_pool)
+    cache = {}
+    logistica_service._ms_usuarios_prefetch(ms, {7, 8, None}, cache)
+    assert set(cache) == {7, 8}
+
+# 9) limit > PEDIDOS_PAGE_SIZE: páginas en paralelo, se corta en la primera incompleta
+def test_ms_pedidos_pagina_en_paralelo(patch_msclient, monkeypatch):
+    monkeypatch.setattr(logistica_service.Settings, "PEDIDOS_PAGE_SIZE", 2)
+    peds = [{"id": str(uuid.uuid4()), "cliente_id": 1} for _ in range(3)]
+    patch_msclient.set_pedidos(peds[:2], _params(limit="2", offset="0"))
+    patch_msclient.set_pedidos(peds[2:], _params(limit="2", offset="2"))
+    patch_msclient.set_pedidos([{"id": "no-debe-llegar"}], _params(limit="1", offset="4"))
+
+    ms = logistica_service.MsClient("co")
+    # cada GET espera a que las 3 páginas estén en vuelo; si fueran en serie,
+    # la barrera vence y el servicio responde 404
+    barrera = threading.Barrier(3, timeout=2)
+    get_original = ms.get
+    def get_en_barrera(path, params=None):
+        barrera.wait()
+        return get_original(path, params=params)
+    ms.get = get_en_barrera
+
+    out = logistica_service._ms_pedidos_listar_aprobados(
+        ms, fecha=date(2025,10,24), tipo="VENTA", fc_desde=None, fc_hasta=None, limit=5, offset=0
+    )
+    assert out == peds
+    assert len(patch_msclient.pedidos_calls) == 3
+
+def test_ms_pedidos_paginas_con_pool_acotado(patch_msclient, monkeypatch):
+    monkeypatch.setattr(logistica_service.Settings, "PEDIDOS_PAGE_SIZE", 1)
+    monkeypatch.setattr(logistica_service.Settings, "PEDIDOS_MAX_WORKERS", 2)
+    peds = [{"id": str(uuid.uuid4()), "cliente_id": 1} for _ in range(6)]
+    for i, ped in enumerate(peds):
+        patch_msclient.set_pedidos([ped], _params(limit="1", offset=str(i)))
+
+    workers = []
+    pool_original = logistica_service.ThreadPoolExecutor
+    def _pool(max_workers):
+        workers.append(max_workers)
+        return pool_original(max_workers=max_workers)
+    monkeypatch.setattr(logistica_service, "ThreadPoolExecutor", _pool)
+
+    ms = logistica_service.MsClient("co")
+    out = logistica_service._ms_pedidos_listar_aprobados(
+        ms, fecha=date(2025,10,24), tipo="VENTA", fc_desde=None, fc_hasta=None, limit=6, offset=0
+    )
+    assert out == peds
+    assert workers == [2]  # 6 páginas, 2 hilos
+
+def test_ms_pedidos_limit_no_positivo_no_consulta(patch_msclient):
+    ms = logistica_service.MsClient("co")
+    for limit in (0, -1):
+        out = logistica_service._ms_pedidos_listar_aprobados(
+            ms, fecha=date(2025,10,24), tipo="VENTA", fc_desde=None, fc_hasta=None, limit=limit, offset=0
+        )
+        assert out == []
+    assert patch_msclient.pedidos_calls == []
+
+# 10) MsClient compartido por país y cerrado al apagar
+def test_get_ms_reutiliza_cliente_por_pais():
+    co = logistica_service._get_ms("co")
+    assert logistica_service._get_ms("co") is co
+    assert logistica_service._get_ms("pe") is not co
+    # el header se normaliza como el esquema: sin entradas nuevas por mayúsculas/espacios
+    assert logistica_service._get_ms("CO") is co
+    assert logistica_service._get_ms(" co ") is co
+    assert logistica_service._get_ms(None) is co  # DEFAULT_SCHEMA
+    assert set(logistica_service._MS_CLIENTS) == {"co", "pe"}
+    logistica_service.close_ms_clients()
+    assert logistica_service._MS_CLIENTS == {}
+
+# 11) Caché por request: un solo GET a ms-usuarios por cliente, aunque tenga varios pedidos
+def test_generar_ruta_un_get_usuarios_por_cliente(db_session, patch_msclient, usuarios, audit):
+    patch_msclient.set_pedidos([
+        {"id": str(uuid.uuid4()), "cliente_id": cid, "tipo": "VENTA", "estado": "APROBADO"}
+        for cid in (10, 10, 1, 10)
+    ])
+    r = logistica_service.generar_ruta(db_session, date(2025,10,24), audit, tipo="VENTA")
+    assert len(r.paradas) == 2
+    assert sorted(patch_msclient.usuarios_calls) == [1, 10]
@@ -1,21 +1,20 @@
 # tests/test_routes_logistica.py
 import uuid
+import pytest
 from datetime import date
 from src.domain.models import ParadaEstado
 
-def _params(fecha="2025-10-24", tipo="VENTA", limit="200", offset="0"):
-    return tuple(sorted([("tipo",tipo),("estado","APROBADO"),("fecha_compromiso",fecha),("limit",limit),("offset",offset)]))
+pytestmark = pytest.mark.xdist_group("db")
 
 def test_post_generar_ruta_sin_pedidos_devuelve_404(test_app, patch_msclient):
-    patch_msclient["pedidos_default"] = []
+    patch_msclient.set_pedidos([])
     resp = test_app.post("/v1/logistica/rutas/generar?fecha=2025-10-24&tipo=VENTA", headers={"X-Country":"co"})
     assert resp.status_code == 404
     assert resp.json()["detail"] == "No hay ventas para generar ruta de entrega en la fecha seleccionada."
 
-def test_post_generar_ruta_ok_y_listar(test_app, patch_msclient):
+def test_post_generar_ruta_ok_y_listar(test_app, patch_msclient, usuarios):
     pid = str(uuid.uuid4())
-    patch_msclient[("pedidos", _params())] = [{"id": pid, "cliente_id": 10, "tipo":"VENTA","estado":"APROBADO"}]
-    patch_msclient["usuarios"] = {10: {"address":"Cra 10 # 1-1","city":"Bogotá"}}
+    patch_msclient.set_pedidos([{"id": pid, "cliente_id": 10, "tipo":"VENTA","estado":"APROBADO"}])
 
     r = test_app.post("/v1/logistica/rutas/generar?fecha=2025-10-24&tipo=VENTA", headers={"X-Country":"co"})
     assert r.status_code == 201
@@ -31,38 +30,148 @@ def test_post_generar_ruta_ok_y_listar(test_app, patch_msclient):
     assert r2.status_code == 200
     assert r2.json()["id"] == rid
 
-    # Listar por fecha
+    # Listar por fecha: resumen sin paradas salvo include=paradas
     r3 = test_app.get("/v1/logistica/rutas?fecha=2025-10-24", headers={"X-Country":"co"})
     assert r3.status_code == 200
     assert len(r3.json()) == 1
+    assert r3.json()[0]["paradas"] == []
 
-def test_patch_parada_estado_y_finaliza_ruta(test_app, patch_msclient):
-    # Prepara ruta con dos paradas (distinto cliente)
-    p1, p2 = str(uuid.uuid4()), str(uuid.uuid4())
-    patch_msclient[("pedidos", _params())] = [
-        {"id": p1, "cliente_id": 1, "tipo":"VENTA","estado":"APROBADO"},
-        {"id": p2, "cliente_id": 2, "tipo":"VENTA","estado":"APROBADO"},
-    ]
-    patch_msclient["usuarios"] = {
-        1: {"address":"DirA","city":"Bogotá"},
-        2: {"address":"DirB","city":"Bogotá"},
-    }
+    r4 = test_app.get("/v1/logistica/rutas?fecha=2025-10-24&include=paradas", headers={"X-Country":"co"})
+    assert r4.status_code == 200
+    assert r4.json()[0]["paradas"][0]["pedido_ids"] == [pid]
 
-    r = test_app.post("/v1/logistica/rutas/generar?fecha=2025-10-24&tipo=VENTA", headers={"X-Country":"co"})
-    assert r.status_code == 201
-    ruta = r.json()
-    pids = [p["id"] for p in sorted(ruta["paradas"], key=lambda x: x["orden"])]
+def test_patch_parada_estado_y_finaliza_ruta(test_app, generated_ruta):
+    # Ruta con dos paradas (distinto cliente), ya generada por el fixture
+    ruta_id = str(generated_ruta.id)
+    pids = [str(p.id) for p in sorted(generated_ruta.paradas, key=lambda x: x.orden)]
 
     # Entregar primera parada -> ruta EN_RUTA
     r1 = test_app.patch(f"/v1/logistica/paradas/{pids[0]}/estado", json={"estado": "ENTREGADA"}, headers={"X-Country":"co"})
     assert r1.status_code == 200
-    rget = test_app.get(f"/v1/logistica/rutas/{ruta['id']}", headers={"X-Country":"co"})
+    rget = test_app.get(f"/v1/logistica/rutas/{ruta_id}", headers={"X-Country":"co"})
     assert rget.status_code == 200
     assert rget.json()["estado"] in ("EN_RUTA","FINALIZADA")  # puede ya ser FINALIZADA si el orden coincide
 
     # Entregar segunda parada -> ruta FINALIZADA
     r2 = test_app.patch(f"/v1/logistica/paradas/{pids[1]}/estado", json={"estado": "ENTREGADA"}, headers={"X-Country":"co"})
     assert r2.status_code == 200
-    rget2 = test_app.get(f"/v1/logistica/rutas/{ruta['id']}", headers={"X-Country":"co"})
+    rget2 = test_app.get(f"/v1/logistica/rutas/{ruta_id}", headers={"X-Country":"co"})
     assert rget2.status_code == 200
     assert rget2.json()["estado"] == "FINALIZADA"
+
+
+def test_patch_paradas_estado_bulk_finaliza_ruta(test_app, generated_ruta):
+    # Ruta con dos paradas (distinto cliente), ya generada por el fixture
+    ruta_id = str(generated_ruta.id)
+    pids = [str(p.id) for p in sorted(generated_ruta.paradas, key=lambda x: x.orden)]
+
+    # Entregar ambas paradas en un solo PATCH (un commit) -> ruta FINALIZADA
+    resp = test_app.patch(
+        "/v1/logistica/paradas/estado",
+        json={"items": [{"id": pids[0], "estado": "ENTREGADA"}, {"id": pids[1], "estado": "ENTREGADA"}]},
+        headers={"X-Country": "co"},
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [p["id"] for p in body] == pids
+    assert all(p["estado"] == "ENTREGADA" for p in body)
+
+    rget = test_app.get(f"/v1/logistica/rutas/{ruta_id}", headers={"X-Country":"co"})
+    assert rget.status_code == 200
+    assert rget.json()["estado"] == "FINALIZADA"
+
+
+def test_patch_paradas_estado_bulk_404_no_aplica_nada(test_app, generated_ruta):
+    pid = str(sorted(generated_ruta.paradas, key=lambda x: x.orden)[0].id)
+    resp = test_app.patch(
+        "/v1/logistica/paradas/estado",
+        json={"items": [{"id": pid, "estado": "ENTREGADA"}, {"id": str(uuid.uuid4()), "estado": "ENTREGADA"}]},
+        headers={"X-Country": "co"},
+    )
+    assert resp.status_code == 404
+
+    rget = test_app.get(f"/v1/logistica/rutas/{generated_ruta.id}", headers={"X-Country":"co"})
+    assert rget.json()["estado"] == "PLANEADA"
+    assert {p["estado"] for p in rget.json()["paradas"]} == {"PENDIENTE"}
+
+
+def test_get_ruta_cacheada_no_consulta_servicio(test_app, patch_msclient, usuarios, monkeypatch):
+    pid = str(uuid.uuid4())
+    patch_msclient.set_pedidos([{"id": pid, "cliente_id": 10, "tipo":"VENTA","estado":"APROBADO"}])
+    rid = test_app.post("/v1/logistica/rutas/generar?fecha=2025-10-24&tipo=VENTA", headers={"X-Country":"co"}).json()["id"]
+
+    r1 = test_app.get(f"/v1/logistica/rutas/{rid}", headers={"X-Country":"co"})
+    assert r1.status_code == 200
+
+    import src.routes.logistica as logistica_route_mod
+    def _no_db(*_a, **_kw):
+        raise AssertionError("debió responder desde la caché, sin abrir sesión")
+    monkeypatch.setattr(logistica_route_mod, "session_for_schema", _no_db)
+    monkeypatch.setattr(logistica_route_mod.logistica_service, "obtener_ruta", _no_db)
+    r2 = test_app.get(f"/v1/logistica/rutas/{rid}", headers={"X-Country":"co"})
+    assert r2.status_code == 200
+    assert r2.json() == r1.json()
+
+
+def test_get_patch_get_no_sirve_estado_cacheado(test_app, generated_ruta):
+    ruta_id = str(generated_ruta.id)
+    pid = str(sorted(generated_ruta.paradas, key=lambda x: x.orden)[0].id)
+
+    # GET deja la ruta en caché (PLANEADA)
+    r1 = test_app.get(f"/v1/logistica/rutas/{ruta_id}", headers={"X-Country":"co"})
+    assert r1.json()["estado"] == "PLANEADA"
+
+    rp = test_app.patch(f"/v1/logistica/paradas/{pid}/estado", json={"estado": "ENTREGADA"}, headers={"X-Country":"co"})
+    assert rp.status_code == 200
+
+    # el PATCH invalidó la entrada: el segundo GET ve el estado nuevo
+    r2 = test_app.get(f"/v1/logistica/rutas/{ruta_id}", headers={"X-Country":"co"})
+    assert r2.json()["estado"] == "EN_RUTA"
+    assert {p["id"]: p["estado"] for p in r2.json()["paradas"]}[pid] == "ENTREGADA"
+
+
+def test_get_no_cachea_si_un_patch_invalida_durante_la_lectura(test_app, generated_ruta, monkeypatch):
+    import src.routes.logistica as logistica_route_mod
+    ruta_id = str(generated_ruta.id)
+    pid = str(sorted(generated_ruta.paradas, key=lambda x: x.orden)[0].id)
+    key = ("co", generated_ruta.id)
+    original = logistica_route_mod.logistica_service.obtener_ruta
+
+    def _obtener_y_patch(session, rid):
+        ruta = original(session, rid)
+        # el PATCH confirma e invalida entre la lectura del GET y su guardado en caché
+        logistica_route_mod.actualizar_estado_parada(
+            uuid.UUID(pid), logistica_route_mod.ParadaEstadoIn(estado=ParadaEstado.ENTREGADA), schema="co"
+        )
+        monkeypatch.setattr(logistica_route_mod.logistica_service, "obtener_ruta", original)
+        return ruta
+
+    monkeypatch.setattr(logistica_route_mod.logistica_service, "obtener_ruta", _obtener_y_patch)
+    r1 = test_app.get(f"/v1/logistica/rutas/{ruta_id}", headers={"X-Country":"co"})
+    assert r1.status_code == 200
+    assert key not in logistica_route_mod._RUTA_BLOBS
+
+    # el siguiente GET lee el estado confirmado y ese sí queda en caché
+    r2 = test_app.get(f"/v1/logistica/rutas/{ruta_id}", headers={"X-Country":"co"})
+    assert r2.json()["estado"] == "EN_RUTA"
+    assert key in logistica_route_mod._RUTA_BLOBS
+
+
+def test_patch_invalida_cache_despues_del_commit(test_app, generated_ruta, db_session, monkeypatch):
+    import src.routes.logistica as logistica_route_mod
+    from contextlib import contextmanager
+    orden = []
+
+    @contextmanager
+    def _session_for_schema(_schema):
+        yield db_session
+        orden.append("commit")  # session_for_schema confirma al salir
+
+    original = logistica_route_mod._invalidar_ruta
+    monkeypatch.setattr(logistica_route_mod, "session_for_schema", _session_for_schema)
+    monkeypatch.setattr(logistica_route_mod, "_invalidar_ruta", lambda *a: (orden.append("invalidar"), original(*a)))
+
+    pid = str(generated_ruta.paradas[0].id)
+    test_app.patch(f"/v1/logistica/paradas/{pid}/estado", json={"estado": "ENTREGADA"}, headers={"X-Country":"co"})
+    test_app.patch("/v1/logistica/paradas/estado", json={"items": [{"id": pid, "estado": "ENTREGADA"}]}, headers={"X-Country":"co"})
+    assert orden == ["commit", "invalidar", "commit", "invalidar"]